@@ -1,5 +1,8 @@
+import multiprocessing
 import time
-from typing import Callable, Tuple
+from typing import Callable, Optional, Tuple
+
+import numpy as np
 
 from alpha_zero.Player import Player
 from alpha_zero.Board import Board
@@ -8,6 +11,23 @@ from pytorch_classification.utils import AverageMeter
 from pytorch_classification.utils.progress.progress.bar import Bar
 
 
+_arena = None
+'''the Arena of a worker process of Arena.play_games, set up by _init_worker'''
+
+
+def _init_worker(game: Game, players: Callable[[], Tuple[Player, Player]]):
+    global _arena
+    player1, player2 = players()
+    _arena = Arena(player1, player2, game)
+
+
+def _play_game(task: Tuple[bool, int]) -> Tuple[bool, float]:
+    switched, seed = task
+    np.random.seed(seed)
+    arena = Arena(_arena.player2, _arena.player1, _arena.game) if switched else _arena
+    return switched, arena.play_single_game()
+
+
 class Arena():
     """
     An Arena class where any 2 agents can be pit against each other.
@@ -48,10 +68,13 @@ class Arena():
         '''
 
         players = [self.player2, None, self.player1]
+        for player in (self.player1, self.player2):
+            player.reset()
         curPlayer = 1
         board = self.game.getInitBoard()
         it = 0
-        while self.game.getGameEnded(board, curPlayer) == 0:
+        ended = self.game.getGameEnded(board, curPlayer)
+        while ended == 0:
             it += 1
 
             if verbose:
@@ -64,7 +87,7 @@ class Arena():
 
             action = players[curPlayer + 1].play(canonical_board)
 
-            valids = self.game.getValidMoves(canonical_board, curPlayer)
+            valids = self.game.getValidMoves(canonical_board, 1)
 
             if valids[action] == 0:
                 # Invalid action selected...
@@ -72,8 +95,10 @@ class Arena():
                 assert valids[action] > 0
 
             board, curPlayer = self.game.getNextState(board, curPlayer, action)
+            ended = self.game.getGameEndedAfterMove(board, curPlayer, action)
 
-        ended = self.game.getGameEnded(board, 1)
+        # ended is seen from curPlayer, the player to move when the game ended
+        ended = curPlayer * ended
         if verbose:
             assert (self.display)
             print("Game over: Turn ", str(it), "Result ", str(ended))
@@ -81,13 +106,27 @@ class Arena():
 
         return ended
 
-    def play_games(self, number_games:int, verbose:bool=False) -> Tuple[int, int, int]:
+    def play_games(self, number_games:int, verbose:bool=False, workers:int=1,
+                   players: Optional[Callable[[], Tuple[Player, Player]]]=None, seed:int=0) -> Tuple[int, int, int]:
         """
         Plays num games in which player1 starts num/2 games and player2 starts
         num/2 games.
 
+        With players, the games are played in workers processes. The players
+        can not be sent to the processes, so each process builds its own
+        (player1, player2) by calling players, e.g. a function that loads two
+        networks into MCTSPlayers; player1 and player2 only give the names.
+        players must be picklable, so a module level function or a
+        functools.partial of one, not a lambda. Each game is seeded from
+        (seed, game number). For players that do not depend on earlier games,
+        the totals are the same as when the games are played one after
+        another.
+
         :param number_games: number of games to play
-        :param verbose: Print game boards along the way
+        :param verbose: Print game boards along the way, not with players
+        :param workers: number of processes to play the games in
+        :param players: builds the players of a worker process, the games are played here without it
+        :param seed: base seed of the games played in worker processes
 
         :returns oneWon: games won by player1
         :returns twoWon: games won by player2
@@ -103,24 +142,75 @@ class Arena():
         # Because each game is two games, with sides switched
         number_games = int(number_games / 2)
 
-        draws_first, end, eps, oneWon_first, twoWon_first = self._play_games(bar, end, eps, eps_time, maxeps, number_games, verbose)
+        if players is not None:
+            assert not verbose
+            first, second = self._play_games_parallel(bar, eps_time, maxeps, number_games, workers, players, seed)
+            draws_first, oneWon_first, twoWon_first = first
+            draws_second, twoWon_second, oneWon_second = second
+        else:
+            draws_first, end, eps, oneWon_first, twoWon_first = self._play_games(bar, end, eps, eps_time, maxeps, number_games, verbose)
+
+            # Switch the players
+            self.player1, self.player2 = self.player2, self.player1
+
+            draws_second, end, eps, twoWon_second, oneWon_second = self._play_games(bar, end, eps, eps_time, maxeps, number_games, verbose)
+
+            # Switch the players back
+            self.player1, self.player2 = self.player2, self.player1
+
         print("")
         print(f"Player {self.player1.name} won {oneWon_first} times and lost {twoWon_first} against {self.player2.name}")
+        print("")
+        print(f"Player {self.player2.name} won {twoWon_second} times and lost {oneWon_second} against {self.player1.name}")
 
-        # Switch the players
-        self.player1, self.player2 = self.player2, self.player1
+        bar.finish()
 
-        draws_second, end, eps, oneWon_second, twoWon_second = self._play_games(bar, end, eps, eps_time, maxeps, number_games, verbose)
-        print("")
-        print(
-            f"Player {self.player1.name} won {oneWon_second} times and lost {twoWon_second} against {self.player2.name}")
+        return oneWon_first+oneWon_second, twoWon_first+twoWon_second, draws_first+draws_second
 
-        # Switch the players back
-        self.player1, self.player2 = self.player2, self.player1
+    def _play_games_parallel(self, bar: Bar, eps_time: AverageMeter, maxeps: int, number_games: int, workers: int,
+                             players: Callable[[], Tuple[Player, Player]], seed: int) \
+            -> Tuple[Tuple[int, int, int], Tuple[int, int, int]]:
+        '''
+        Play number_games games with player1 starting and number_games with
+        player2 starting, in a pool of processes
 
-        bar.finish()
+        :param bar: the bar chart to update with wins and losses
+        :param eps_time: average time of a game
+        :param maxeps: number of games in total
+        :param number_games: number of games to play with each player starting
+        :param workers: number of processes
+        :param players: builds the players of a worker process
+        :param seed: base seed of the games
+        :returns first: (draws, oneWon, twoWon) of the games player1 started
+        :returns second: (draws, firstWon, secondWon) of the games player2 started,
+                         firstWon is the number of games won by player2
+        '''
+        tasks = [(switched, int(np.random.RandomState([seed, game]).randint(2 ** 31)))
+                 for game, switched in enumerate([False] * number_games + [True] * number_games)]
+        counts = {False: [0, 0, 0], True: [0, 0, 0]}
 
-        return oneWon_first+twoWon_second, twoWon_first+oneWon_second, draws_first+draws_second
+        end = time.time()
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(workers, initializer=_init_worker, initargs=(self.game, players)) as pool:
+            for eps, (switched, gameResult) in enumerate(pool.imap_unordered(_play_game, tasks)):
+                # draws, games won by the starting player, games won by the other
+                counts[switched][{1: 1, -1: 2}.get(gameResult, 0)] += 1
+
+                # bookkeeping + plot progress, seen from player1
+                eps_time.update(time.time() - end)
+                end = time.time()
+                bar.suffix = '({eps}/{maxeps}) ({won}/{loss}/{draw}) Eps Time: {et:.3f}s | Total: {total:} | ETA: {eta:}'.format(
+                    eps=eps + 1,
+                    maxeps=maxeps,
+                    won=counts[False][1] + counts[True][2],
+                    loss=counts[False][2] + counts[True][1],
+                    draw=counts[False][0] + counts[True][0],
+                    et=eps_time.avg,
+                    total=bar.elapsed_td,
+                    eta=bar.eta_td)
+                bar.next()
+
+        return tuple(counts[False]), tuple(counts[True])
 
     def _play_games(self, bar: Bar, end: float, eps:int, eps_time: AverageMeter, maxeps: int, number_games: int, verbose:bool) -> Tuple[int,float,int,int,int]:
         '''
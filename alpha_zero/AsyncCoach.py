@@ -0,0 +1,235 @@
+import multiprocessing
+import queue
+import threading
+from collections import deque
+from functools import partial
+
+from alpha_zero.Arena import Arena
+from alpha_zero.Coach import Coach, _arena_players
+from alpha_zero.ExampleSampler import ExampleSampler
+from alpha_zero.Game import Game
+from alpha_zero.NeuralNet import NeuralNet
+from alpha_zero.Player import Player
+from alpha_zero.SelfPlayPool import SelfPlayPool
+
+
+class AsyncCoach(Coach):
+    """
+    Coach with self-play, training and evaluation running at the same time,
+    instead of one after another, so an iteration takes about as long as the
+    slowest of them rather than all three together.
+
+    - Self-play: args.numSelfPlayWorkers processes (at least one) play
+      iterations of numEps episodes with the latest accepted network. A
+      thread collects the episodes and puts each iteration on a queue, which
+      holds at most one iteration, so self-play is at most one iteration
+      ahead of training and picks up a newly accepted network soon.
+    - Training: learn() takes the iterations that have ended off the queue,
+      adds them to the history and trains the network, numIters times. After
+      each round the network is saved as candidate_<i>.pth.tar.
+    - Evaluation: a thread pits the newest candidate against the accepted
+      network in args.numArenaWorkers processes (at least one). A candidate
+      that wins becomes the accepted network, which self-play loads from its
+      next iteration on. Older candidates that were not evaluated yet are
+      skipped.
+
+    When learn() ends, the iterations self-play has finished but training
+    has not taken yet are still saved to the history, only the iteration
+    that is being played is dropped. The history is recorded for the
+    candidate that played its newest iteration, so a run is resumed from a
+    candidate_<i> file rather than from checkpoint_<i>.
+
+    The stages only share the queue and the checkpoint files. Checkpoints are
+    never overwritten while another stage may read them: each candidate has
+    its own file. An accepted candidate is also saved as checkpoint_<i> and
+    best.pth.tar, as Coach does.
+
+    Unlike Coach, the network is not reset when a candidate is rejected:
+    training goes on from its own latest network, and evaluation only decides
+    which network plays the self-play games.
+
+    The self-play workers load the accepted network from its checkpoint, so
+    args.inferenceServer is not used.
+    """
+
+    def __init__(self, game: Game, nnet: NeuralNet, args):
+        super().__init__(game, nnet, args)
+
+        self.iterations = queue.Queue(maxsize=1)
+        '''(iteration, network file, examples) of the self-play iterations that have not been trained on yet'''
+
+        self.candidates = queue.Queue()
+        '''(training iteration, checkpoint file) of the networks to evaluate, None when training is done'''
+
+        self.acceptedCandidates = queue.Queue()
+        '''(training iteration, checkpoint file) of the accepted networks, to save as checkpoint_<i> and best'''
+
+        self.accepted = None
+        '''the checkpoint file of the accepted network, that self-play uses'''
+
+        self.stopping = threading.Event()
+        self.failure = None
+        '''the exception that ended the self-play or evaluation thread'''
+
+    def learn(self):
+        """
+        Performs numIters rounds of training on the examples self-play has
+        delivered so far, while self-play and evaluation go on in the
+        background. See the class documentation.
+        """
+        self.accepted = self.getCandidateFile(0)
+        self.nnet.save_checkpoint(folder=self.checkpoint, filename=self.accepted)
+
+        workers = max(1, self.args.get('numSelfPlayWorkers', 1))
+        pool = SelfPlayPool(self.game, self.nnet.__class__, self.args, workers)
+        selfPlay = threading.Thread(target=self._run, args=(self._selfPlay, pool), name='SelfPlay', daemon=True)
+        evaluation = threading.Thread(target=self._run, args=(self._evaluate,), name='Evaluation', daemon=True)
+        selfPlay.start()
+        evaluation.start()
+
+        try:
+            for i in range(1, self.numIterations + 1):
+
+                # bookkeeping
+                print('------ITER ' + str(i) + '------')
+                self._saveAccepted()
+
+                # wait for a self-play iteration, and take the ones that ended since
+                if not self.skipFirstSelfPlay or i > 1:
+                    self._addIteration(self._nextIteration())
+                    while True:
+                        try:
+                            self._addIteration(self.iterations.get_nowait())
+                        except queue.Empty:
+                            break
+
+                # the network draws shuffled batches from the shards of the history
+                symmetries = self.game.getSymmetryPermutations() if self.lazySymmetries else None
+                trainExamples = ExampleSampler(self.trainExamplesHistory.shards, symmetries=symmetries,
+                                               counts=self.trainExamplesHistory.counts)
+                self.nnet.train(trainExamples)
+
+                candidate = self.getCandidateFile(i)
+                self.nnet.save_checkpoint(folder=self.checkpoint, filename=candidate)
+                self.candidates.put((i, candidate))
+
+            # let the evaluation of the last candidate finish
+            self.candidates.put(None)
+            evaluation.join()
+            self._saveAccepted()
+            self._check()
+        finally:
+            self.stopping.set()
+            self.candidates.put(None)
+            # keep the examples of the iterations self-play finishes while it stops
+            while selfPlay.is_alive() or not self.iterations.empty():
+                try:
+                    self._addIteration(self.iterations.get(timeout=1))
+                except queue.Empty:
+                    pass
+            selfPlay.join()
+            pool.terminate()
+
+    def getCandidateFile(self, iteration):
+        return 'candidate_' + str(iteration) + '.pth.tar'
+
+    def _run(self, stage, *args):
+        # runs a stage in its thread, and hands an exception to learn()
+        try:
+            stage(*args)
+        except BaseException as e:
+            self.failure = e
+            self.stopping.set()
+
+    def _check(self):
+        if self.failure is not None:
+            raise self.failure
+
+    def _selfPlay(self, pool: SelfPlayPool):
+        iteration = 0
+        while not self.stopping.is_set():
+            iteration += 1
+            accepted = self.accepted
+            iterationTrainExamples = deque([], maxlen=self.maxlenOfQueue)
+
+            episodes = pool.play(self.checkpoint, accepted, iteration, self.numEpisodes,
+                                 seed=self.args.get('selfPlaySeed', 0))
+            for _ in range(self.numEpisodes):
+                # wait for the next episode, but not past learn() ending
+                while True:
+                    if self.stopping.is_set():
+                        return
+                    try:
+                        iterationTrainExamples += episodes.next(timeout=1)
+                        break
+                    except multiprocessing.TimeoutError:
+                        pass
+
+            print("Self play iteration " + str(iteration) + " with " + accepted + " ended")
+            # learn() takes the iteration off the queue, also while it is stopping
+            self.iterations.put((iteration, accepted, iterationTrainExamples))
+
+    def _nextIteration(self):
+        while True:
+            self._check()
+            try:
+                return self.iterations.get(timeout=1)
+            except queue.Empty:
+                pass
+
+    def _addIteration(self, selfPlayIteration):
+        # the history is recorded for the network that played the iteration
+        iteration, accepted, iterationTrainExamples = selfPlayIteration
+        self.saveTrainExamples(iteration, iterationTrainExamples, modelFile=accepted)
+
+    def _evaluate(self):
+        while True:
+            # only the newest candidate is evaluated
+            candidate = self.candidates.get()
+            done = candidate is None
+            while not done:
+                try:
+                    newer = self.candidates.get_nowait()
+                except queue.Empty:
+                    break
+                if newer is None:
+                    done = True
+                else:
+                    candidate = newer
+
+            if candidate is not None:
+                self._evaluateCandidate(*candidate)
+            if done:
+                return
+
+    def _evaluateCandidate(self, iteration: int, candidate: str):
+        print('PITTING ' + candidate + ' AGAINST ' + self.accepted)
+        arena = Arena(Player("PREVIOUS"), Player("NEW"), self.game)
+        players = partial(_arena_players, self.game, self.nnet.__class__, self.args,
+                          self.checkpoint, self.accepted, candidate)
+        pwins, nwins, draws = arena.play_games(self.arenaCompare, workers=max(1, self.args.get('numArenaWorkers', 1)),
+                                               players=players)
+
+        print("")
+        print(f'NEW/PREV WINS : {nwins} / {pwins} ; DRAWS : {draws}')
+        print("")
+
+        if pwins + nwins > 0 and float(nwins) / (pwins + nwins) < self.updateThreshold:
+            print('REJECTING NEW MODEL')
+        else:
+            print('ACCEPTING NEW MODEL')
+            self.accepted = candidate
+            self.acceptedCandidates.put((iteration, candidate))
+
+    def _saveAccepted(self):
+        # the network of learn() has moved on, the accepted ones are loaded from their candidate files
+        while True:
+            try:
+                iteration, candidate = self.acceptedCandidates.get_nowait()
+            except queue.Empty:
+                return
+            if self.pnet is None:
+                self.pnet = self.nnet.__class__(self.game)
+            self.pnet.load_checkpoint(folder=self.checkpoint, filename=candidate)
+            self.pnet.save_checkpoint(folder=self.checkpoint, filename=self.getCheckpointFile(iteration))
+            self.pnet.save_checkpoint(folder=self.checkpoint, filename='best.pth.tar')
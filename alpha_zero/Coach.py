@@ -1,17 +1,33 @@
 from collections import deque
+from functools import partial
 
-from alpha_zero.Player import Player
 from pytorch_classification.utils import AverageMeter
 from pytorch_classification.utils.progress.progress.bar import Bar
 
 from alpha_zero.Game import Game
 from alpha_zero.NeuralNet import NeuralNet
 from alpha_zero.Arena import Arena
+from alpha_zero.ExampleSampler import ExampleSampler
 from alpha_zero.MCTS import MCTS
+from alpha_zero.MCTSPlayer import MCTSPlayer
+from alpha_zero.ReplayStore import ReplayStore, merge_duplicates
+from alpha_zero.SelfPlayPool import SelfPlayPool
 import numpy as np
 import time, os, sys
-from pickle import Pickler, Unpickler
-from random import shuffle
+from pickle import Unpickler
+
+
+def _arena_players(game: Game, nnet_class, args, folder: str, previous: str, new: str):
+    '''
+    Builds the players of Coach's arena in a worker process of Arena.play_games
+
+    :return: (previous, new): MCTSPlayers with the networks of the checkpoints folder/previous and folder/new
+    '''
+    pnet = nnet_class(game)
+    pnet.load_checkpoint(folder=folder, filename=previous)
+    nnet = nnet_class(game)
+    nnet.load_checkpoint(folder=folder, filename=new)
+    return MCTSPlayer("PREVIOUS", game, pnet, args), MCTSPlayer("NEW", game, nnet, args)
 
 
 class Coach():
@@ -23,7 +39,7 @@ class Coach():
     def __init__(self, game: Game, nnet: NeuralNet, args):
         self.game = game
         self.nnet = nnet
-        self.pnet = self.nnet.__class__(self.game)  # the competitor network
+        self.pnet = None  # the competitor network, created when it is first needed
 
         self.args = args
 
@@ -36,11 +52,15 @@ class Coach():
         self.numEpisodes = args.numEpisodes
         self.numItersForTrainExamplesHistory = args.numItersForTrainExamplesHistory
         self.arenaCompare = args.arenaCompare
+        # store one example per position, and let ExampleSampler apply the symmetries
+        self.lazySymmetries = args.get('lazySymmetries', False) and self.game.getSymmetryPermutations() is not None
 
 
         self.mcts = MCTS(self.game, self.nnet, self.args)
-        self.trainExamplesHistory = []  # history of examples from args.numItersForTrainExamplesHistory latest iterations
+        # history of examples from args.numItersForTrainExamplesHistory latest iterations
+        self.trainExamplesHistory = ReplayStore(self.checkpoint, self.numItersForTrainExamplesHistory)
         self.skipFirstSelfPlay = False  # can be overriden in loadTrainExamples()
+        self.selfPlayPool = None  # the self-play worker processes while learn() runs
 
     def executeEpisode(self):
         """
@@ -68,14 +88,18 @@ class Coach():
             temperature = int(episodeStep < self.tempThreshold)
 
             action_prop_vector = self.mcts.getActionProb(canonicalBoard, temperature=temperature)
-            symmetries = self.game.getSymmetries(canonicalBoard, action_prop_vector)
-            for board, action_prop_for_board in symmetries:
-                trainExamples.append([board, self.curPlayer, action_prop_for_board, None])
+            if self.lazySymmetries:
+                # the symmetries are applied when the training batches are drawn
+                symmetries = [(canonicalBoard, action_prop_vector)]
+            else:
+                symmetries = self.game.getSymmetries(canonicalBoard, action_prop_vector)
+            for symmetric_board, action_prop_for_board in symmetries:
+                trainExamples.append([symmetric_board, self.curPlayer, self.game.getPolicyTarget(action_prop_for_board), None])
 
             action = np.random.choice(len(action_prop_vector), p=action_prop_vector)
             board, self.curPlayer = self.game.getNextState(board, self.curPlayer, action)
 
-            r = self.game.getGameEnded(board, self.curPlayer)
+            r = self.game.getGameEndedAfterMove(board, self.curPlayer, action)
 
             if r != 0:
                 #example[0]: Board
@@ -84,6 +108,16 @@ class Coach():
 
                 return [(example[0], example[2], r * ((-1) ** (example[1] != self.curPlayer))) for example in trainExamples]
 
+    def selfPlayEpisodes(self):
+        """
+        Plays numEps episodes of self-play in this process, each with a new search tree.
+
+        :returns: generator of the trainExamples of each episode, see executeEpisode
+        """
+        for _ in range(self.numEpisodes):
+            self.mcts = MCTS(self.game, self.nnet, self.args)  # reset search tree
+            yield self.executeEpisode()
+
     def learn(self):
         """
         Performs numIters iterations with numEps episodes of self-play in each
@@ -93,105 +127,152 @@ class Coach():
         only if it wins >= updateThreshold fraction of games.
         """
 
-        for i in range(1, self.numIterations + 1):
-
-            # bookkeeping
-            print('------ITER ' + str(i) + '------')
+        # the processes that play the episodes when args.numSelfPlayWorkers > 1,
+        # with args.inferenceServer they share self.nnet instead of loading copies
+        workers = self.args.get('numSelfPlayWorkers', 1)
+        self.selfPlayPool = None
+        if workers > 1:
+            server = self.nnet if self.args.get('inferenceServer', False) else None
+            self.selfPlayPool = SelfPlayPool(self.game, self.nnet.__class__, self.args, workers, server=server)
 
-            # examples of the iteration
-            if not self.skipFirstSelfPlay or i > 1:
-                iterationTrainExamples = deque([], maxlen=self.maxlenOfQueue)
+        try:
+            for i in range(1, self.numIterations + 1):
 
-                eps_time = AverageMeter()
-                bar = Bar('Self Play', max=self.numEpisodes)
-                end = time.time()
+                # bookkeeping
+                print('------ITER ' + str(i) + '------')
 
-                for eps in range(self.numEpisodes):
-                    self.mcts = MCTS(self.game, self.nnet, self.args)  # reset search tree
-                    iterationTrainExamples += self.executeEpisode()
+                # examples of the iteration
+                if not self.skipFirstSelfPlay or i > 1:
+                    iterationTrainExamples = deque([], maxlen=self.maxlenOfQueue)
 
-                    # bookkeeping + plot progress
-                    eps_time.update(time.time() - end)
+                    eps_time = AverageMeter()
+                    bar = Bar('Self Play', max=self.numEpisodes)
                     end = time.time()
-                    bar.suffix = '({eps}/{maxeps}) Eps Time: {et:.3f}s | Total: {total:} | ETA: {eta:}'.format(
-                        eps=eps + 1, maxeps=self.numEpisodes, et=eps_time.avg,
-                        total=bar.elapsed_td, eta=bar.eta_td)
-                    bar.next()
-                bar.finish()
-
-                # save the iteration examples to the history 
-                self.trainExamplesHistory.append(iterationTrainExamples)
-
-            if len(self.trainExamplesHistory) > self.args.numItersForTrainExamplesHistory:
-                print("len(trainExamplesHistory) =", len(self.trainExamplesHistory),
-                      " => remove the oldest trainExamples")
-                self.trainExamplesHistory.pop(0)
-            # backup history to a file
-            # NB! the examples were collected using the model from the previous iteration, so (i-1)  
-            self.saveTrainExamples(i - 1)
-
-            # shuffle examlpes before training
-            trainExamples = []
-            for e in self.trainExamplesHistory:
-                trainExamples.extend(e)
-            shuffle(trainExamples)
-
-            # training new network, keeping a copy of the old one
-            self.nnet.save_checkpoint(folder=self.checkpoint, filename='temp.pth.tar')
-            self.pnet.load_checkpoint(folder=self.checkpoint, filename='temp.pth.tar')
-            pmcts = MCTS(self.game, self.pnet, self.args)
-
-            self.nnet.train(trainExamples)
-            nmcts = MCTS(self.game, self.nnet, self.args)
-
-
-            print('PITTING AGAINST PREVIOUS VERSION')
-            player1=Player("PREVIOUS")
-            player1.play = lambda board: np.argmax(pmcts.getActionProb(board, temperature=0))
-
-            player2=Player("NEW")
-            player2.play = lambda board: np.argmax(nmcts.getActionProb(board, temperature=0))
-
-            arena = Arena(player1, player2, self.game)
-            pwins, nwins, draws = arena.play_games(self.arenaCompare)
-
-            print("")
-            print(f'NEW/PREV WINS : {nwins} / {pwins} ; DRAWS : {draws}')
-            print("")
-
-            if pwins + nwins > 0 and float(nwins) / (pwins + nwins) < self.updateThreshold:
-                print('REJECTING NEW MODEL')
-                self.nnet.load_checkpoint(folder=self.checkpoint, filename='temp.pth.tar')
-            else:
-                print('ACCEPTING NEW MODEL')
-                self.nnet.save_checkpoint(folder=self.checkpoint, filename=self.getCheckpointFile(i))
-                self.nnet.save_checkpoint(folder=self.checkpoint, filename='best.pth.tar')
+
+                    # the episodes of the iteration, in the order they end
+                    if self.selfPlayPool is not None:
+                        if self.selfPlayPool.server is None:
+                            self.nnet.save_checkpoint(folder=self.checkpoint, filename='selfplay.pth.tar')
+                        episodes = self.selfPlayPool.play(self.checkpoint, 'selfplay.pth.tar', i, self.numEpisodes,
+                                                          seed=self.args.get('selfPlaySeed', 0))
+                    else:
+                        episodes = self.selfPlayEpisodes()
+
+                    try:
+                        for eps, episodeTrainExamples in enumerate(episodes):
+                            iterationTrainExamples += episodeTrainExamples
+
+                            # bookkeeping + plot progress
+                            eps_time.update(time.time() - end)
+                            end = time.time()
+                            bar.suffix = '({eps}/{maxeps}) Eps Time: {et:.3f}s | Total: {total:} | ETA: {eta:}'.format(
+                                eps=eps + 1, maxeps=self.numEpisodes, et=eps_time.avg,
+                                total=bar.elapsed_td, eta=bar.eta_td)
+                            bar.next()
+                    except Exception:
+                        # a worker fails when the inference server does, report why the server failed
+                        if self.selfPlayPool is not None:
+                            self.selfPlayPool.check()
+                        raise
+                    bar.finish()
+
+                    # save the iteration examples to the history
+                    # NB! the examples were collected using the model from the previous iteration, so (i-1)
+                    self.saveTrainExamples(i - 1, iterationTrainExamples)
+
+                # the network draws shuffled batches from the shards of the history
+                symmetries = self.game.getSymmetryPermutations() if self.lazySymmetries else None
+                trainExamples = ExampleSampler(self.trainExamplesHistory.shards, symmetries=symmetries,
+                                               counts=self.trainExamplesHistory.counts)
+
+                # training new network, keeping a copy of the old one
+                if self.pnet is None:
+                    self.pnet = self.nnet.__class__(self.game)
+                self.nnet.save_checkpoint(folder=self.checkpoint, filename='temp.pth.tar')
+                self.pnet.load_checkpoint(folder=self.checkpoint, filename='temp.pth.tar')
+
+                self.nnet.train(trainExamples)
+
+
+                print('PITTING AGAINST PREVIOUS VERSION')
+                player1 = MCTSPlayer("PREVIOUS", self.game, self.pnet, self.args)
+                player2 = MCTSPlayer("NEW", self.game, self.nnet, self.args)
+
+                # with args.numArenaWorkers > 1 the games are played in that many processes,
+                # which load both networks from their checkpoints
+                arena = Arena(player1, player2, self.game)
+                arenaWorkers = self.args.get('numArenaWorkers', 1)
+                players = None
+                if arenaWorkers > 1:
+                    self.nnet.save_checkpoint(folder=self.checkpoint, filename='arena.pth.tar')
+                    players = partial(_arena_players, self.game, self.nnet.__class__, self.args,
+                                      self.checkpoint, 'temp.pth.tar', 'arena.pth.tar')
+                pwins, nwins, draws = arena.play_games(self.arenaCompare, workers=arenaWorkers, players=players)
+
+                print("")
+                print(f'NEW/PREV WINS : {nwins} / {pwins} ; DRAWS : {draws}')
+                print("")
+
+                if pwins + nwins > 0 and float(nwins) / (pwins + nwins) < self.updateThreshold:
+                    print('REJECTING NEW MODEL')
+                    self.nnet.load_checkpoint(folder=self.checkpoint, filename='temp.pth.tar')
+                else:
+                    print('ACCEPTING NEW MODEL')
+                    self.nnet.save_checkpoint(folder=self.checkpoint, filename=self.getCheckpointFile(i))
+                    self.nnet.save_checkpoint(folder=self.checkpoint, filename='best.pth.tar')
+        finally:
+            if self.selfPlayPool is not None:
+                self.selfPlayPool.close()
+                self.selfPlayPool = None
 
     def getCheckpointFile(self, iteration):
         return 'checkpoint_' + str(iteration) + '.pth.tar'
 
-    def saveTrainExamples(self, iteration):
+    def saveTrainExamples(self, iteration, iterationTrainExamples, modelFile=None):
+        """
+        Adds the examples of an iteration to the history, which writes them
+        to a new shard in the checkpoint folder, and records the shards of the
+        history in modelFile + ".shards", for loadTrainExamples.
+
+        :param modelFile: the model the history belongs to, the checkpoint of iteration by default
+        """
         print("Saving training examples from iteration "+str(iteration))
-        folder = self.checkpoint
-        if not os.path.exists(folder):
-            os.makedirs(folder)
-        filename = os.path.join(folder, self.getCheckpointFile(iteration) + ".examples")
-        with open(filename, "wb+") as f:
-            Pickler(f).dump(self.trainExamplesHistory)
-        f.closed
+        if self.args.get('mergeDuplicateExamples', False):
+            # one example per board, with the averaged targets, drawn as often as the board occurred
+            merged, counts = merge_duplicates(iterationTrainExamples, self.game.getStateKey)
+            print("Merged " + str(len(iterationTrainExamples)) + " examples into " + str(len(merged)))
+            self.trainExamplesHistory.add(merged, counts)
+        else:
+            self.trainExamplesHistory.add(iterationTrainExamples)
+
+        if modelFile is None:
+            modelFile = self.getCheckpointFile(iteration)
+        self.trainExamplesHistory.save_manifest(os.path.join(self.checkpoint, modelFile) + ".shards")
 
     def loadTrainExamples(self):
-        modelFile = os.path.join(self.load_folder_file[0], self.load_folder_file[1])
+        """
+        Adds the shards of examples recorded for the model of
+        args.load_folder_file (the model file + ".shards") to the history.
+        A history pickled by earlier versions to the model file + ".examples"
+        is converted to shards in that folder and recorded for the model, so
+        it is only converted once.
+        """
+        folder = self.load_folder_file[0]
+        modelFile = os.path.join(folder, self.load_folder_file[1])
         examplesFile = modelFile + ".examples"
-        if not os.path.isfile(examplesFile):
+        if self.trainExamplesHistory.load(modelFile + ".shards"):
+            print("Shards with trainExamples found for " + modelFile)
+        elif os.path.isfile(examplesFile):
+            print("File with trainExamples found. Read it.")
+            with open(examplesFile, "rb") as f:
+                for iterationTrainExamples in Unpickler(f).load():
+                    self.trainExamplesHistory.add(iterationTrainExamples, folder=folder)
+            self.trainExamplesHistory.save_manifest(modelFile + ".shards")
+        else:
             print(examplesFile)
             r = input("File with trainExamples not found. Continue? [y|n]")
             if r != "y":
                 sys.exit()
-        else:
-            print("File with trainExamples found. Read it.")
-            with open(examplesFile, "rb") as f:
-                self.trainExamplesHistory = Unpickler(f).load()
-            f.closed
-            # examples based on the model were already collected (loaded)
-            self.skipFirstSelfPlay = True
+            return
+        # examples based on the model were already collected (loaded)
+        self.skipFirstSelfPlay = True
@@ -0,0 +1,135 @@
+from typing import Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+Batch = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+class ExampleSampler():
+    """
+    Draws training batches straight from the (boards, pis, vs) arrays of the
+    shards of a ReplayStore, so the examples are not flattened into one
+    list, shuffled and converted by the networks first.
+
+    A batch is a set of indices into all shards together. The indices are
+    sorted, so the rows of each shard are read in file order, and gathered
+    into new contiguous float32 arrays of batch size. Only the batches are
+    copied, the shards stay where they are, in memory or memory-mapped.
+
+    With symmetries, each example of a batch is replaced by a random one of
+    its symmetries, so the shards only need to hold one example per
+    position instead of all of its symmetries.
+
+    With counts, for shards whose duplicate examples were merged (see
+    merge_duplicates in alpha_zero.ReplayStore), the examples are drawn
+    with replacement, in proportion to the number of examples merged into
+    them, and an epoch is as many batches as there are merged examples.
+    """
+
+    def __init__(self, shards: Sequence[Batch], symmetries: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                 counts: Optional[Sequence[Optional[np.ndarray]]] = None):
+        """
+        :param shards: (boards, pis, vs) arrays with the same number of rows each
+        :param symmetries: (board_permutations, target_permutations) to augment the batches with,
+                           see Game.getSymmetryPermutations
+        :param counts: for each shard, the counts of its rows, or None if all are 1
+        """
+        if counts is None:
+            counts = [None] * len(shards)
+        self.shards = [shard for shard in shards if len(shard[2])]
+        self.symmetries = symmetries
+        self.offsets = np.cumsum([0] + [len(vs) for _, _, vs in self.shards])
+        '''offsets[i]: the index of the first example of shard i'''
+
+        self.probabilities = None
+        '''the probability of drawing each example, None to draw them uniformly'''
+        if any(shard_counts is not None for shard_counts in counts):
+            weights = np.concatenate([np.ones(len(shard[2])) if shard_counts is None else shard_counts
+                                      for shard, shard_counts in zip(shards, counts) if len(shard[2])])
+            self.probabilities = weights / weights.sum()
+
+    @classmethod
+    def of(cls, examples) -> 'ExampleSampler':
+        '''
+        :param examples: an ExampleSampler, or a list of examples (board, pi, v)
+        :return: a sampler of the examples
+        '''
+        if isinstance(examples, cls):
+            return examples
+        boards, pis, vs = zip(*examples)
+        return cls([(np.asarray(boards), np.asarray(pis, dtype=np.float32), np.asarray(vs, dtype=np.float32))])
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def steps(self, batch_size: int) -> int:
+        '''
+        :param batch_size: number of examples in a batch
+        :return: the number of batches of an epoch
+        '''
+        return -(-len(self) // batch_size)
+
+    def batches(self, batch_size: int) -> Iterator[Batch]:
+        '''
+        One epoch: every example once, in random order, or as many examples
+        drawn by their counts
+
+        :param batch_size: number of examples in a batch, the last batch can be smaller
+        :return: iterator over the batches (boards, pis, vs)
+        '''
+        if self.probabilities is None:
+            order = np.random.permutation(len(self))
+        else:
+            order = np.random.choice(len(self), size=len(self), p=self.probabilities)
+        for start in range(0, len(order), batch_size):
+            yield self.gather(order[start:start + batch_size])
+
+    def generate(self, batch_size: int) -> Iterator[Batch]:
+        '''
+        Epoch after epoch, for training loops that take a generator and the
+        number of steps of an epoch, see steps
+
+        :param batch_size: number of examples in a batch
+        :return: endless iterator over the batches (boards, pis, vs)
+        '''
+        while True:
+            yield from self.batches(batch_size)
+
+    def sample(self, batch_size: int) -> Batch:
+        '''
+        :param batch_size: number of examples in the batch
+        :return: a batch (boards, pis, vs) of examples drawn with replacement
+        '''
+        if self.probabilities is None:
+            return self.gather(np.random.randint(len(self), size=batch_size))
+        return self.gather(np.random.choice(len(self), size=batch_size, p=self.probabilities))
+
+    def gather(self, indices: np.ndarray) -> Batch:
+        '''
+        :param indices: indices of examples
+        :return: (boards, pis, vs) of the examples as float32 arrays, in the order of the sorted indices,
+                 each example turned by a random symmetry if the sampler has them
+        '''
+        indices = np.sort(indices)
+        boards, pis, _ = self.shards[0]
+        batch = (np.empty((len(indices),) + boards.shape[1:], dtype=np.float32),
+                 np.empty((len(indices),) + pis.shape[1:], dtype=np.float32),
+                 np.empty(len(indices), dtype=np.float32))
+
+        # indices[bounds[i]:bounds[i+1]] are the examples of shard i
+        bounds = np.searchsorted(indices, self.offsets)
+        for shard, offset, start, stop in zip(self.shards, self.offsets, bounds[:-1], bounds[1:]):
+            if start == stop:
+                continue
+            rows = indices[start:stop] - offset
+            for part, array in zip(batch, shard):
+                part[start:stop] = array[rows]
+
+        if self.symmetries is not None:
+            board_permutations, target_permutations = self.symmetries
+            k = np.random.randint(len(board_permutations), size=len(indices))
+            boards, pis, vs = batch
+            boards = np.take_along_axis(boards.reshape(len(indices), -1), board_permutations[k], axis=1)
+            batch = (boards.reshape(batch[0].shape), np.take_along_axis(pis, target_permutations[k], axis=1), vs)
+        return batch
+
@@ -1,4 +1,6 @@
-from typing import Tuple, List
+from typing import Tuple, Optional, Hashable
+
+import numpy as np
 
 from alpha_zero.Player import Player
 from alpha_zero.Board import Board
@@ -36,6 +38,40 @@ class Game():
         """
         pass
 
+    def getPolicySize(self) -> int:
+        """
+        Optional. The length of the policy vector the neural network predicts
+        and is trained on. Defaults to getActionSize(); games with a factored
+        policy (see expandPolicy) predict fewer numbers.
+
+        :returns: length of the policy vector of the neural network
+        """
+        return self.getActionSize()
+
+    def expandPolicy(self, policy: np.ndarray, valid_moves: np.ndarray) -> np.ndarray:
+        """
+        Optional. Turns the policy predicted by the neural network into a
+        policy over the actions. MCTS renormalises the result.
+
+        :param policy: policy vector of size self.getPolicySize()
+        :param valid_moves: getValidMoves for the board
+
+        :returns: a vector of size self.getActionSize() with the prior of
+                       every valid move and 0 for the invalid ones
+        """
+        return policy * valid_moves
+
+    def getPolicyTarget(self, pi: np.ndarray) -> np.ndarray:
+        """
+        Optional. Turns a policy over the actions, as MCTS returns it, into
+        the training target of the neural network.
+
+        :param pi: policy vector of size self.getActionSize()
+
+        :returns: policy vector of size self.getPolicySize()
+        """
+        return pi
+
     def getNextState(self, board: Board, player: int, action) -> Tuple[Board,int]:
         """
         :param board: current board
@@ -47,15 +83,17 @@ class Game():
         """
         pass
 
-    def getValidMoves(self, board: Board, player: int) -> List[int]:
+    def getValidMoves(self, board: Board, player: int) -> np.ndarray:
         """
 
         :param board: current board
         :param player: current player
 
-        :returns: a binary vector of length self.getActionSize(), 1 for
-                        moves that are valid from the current board and player,
-                        0 for invalid moves
+        :returns: a boolean numpy vector of length self.getActionSize(), True
+                        for moves that are valid from the current board and
+                        player, False for invalid moves. The vector may be
+                        shared (see alpha_zero/ValidMovesMemo.py), so make it
+                        read-only and do not modify it.
         """
         pass
 
@@ -71,6 +109,20 @@ class Game():
         """
         pass
 
+    def getGameEndedAfterMove(self, board: Board, player: int, action: int) -> float:
+        """
+        Optional. getGameEnded for a board that had not ended before action
+        was played on it. Placement games, where only the lines through the
+        new stone can have been completed, can check just those.
+
+        :param board: board after action was played
+        :param player: current player (1 or -1)
+        :param action: the action that was played to reach board
+
+        :returns: the same as getGameEnded(board, player)
+        """
+        return self.getGameEnded(board, player)
+
     def getCanonicalForm(self, board: Board, player: int) -> Board:
         """
 
@@ -98,6 +150,36 @@ class Game():
         """
         pass
 
+    def getSymmetryPermutations(self) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Optional. The symmetries of getSymmetries as index permutations, so
+        Coach can store one example per position and the training batches
+        can be augmented when they are drawn (args.lazySymmetries).
+
+        :returns: (board_permutations, target_permutations): for each symmetry k,
+                       the symmetric board is board.ravel()[board_permutations[k]]
+                       and its policy target (see getPolicyTarget) is
+                       target[target_permutations[k]]. None for games without
+                       them, whose examples are stored with all their symmetries.
+        """
+        return None
+
+    def getCanonicalSymmetry(self, board: Board) -> Tuple[Board, Optional[np.ndarray]]:
+        """
+        Optional. Lets MCTS store all the symmetries of a board (the ones
+        getSymmetries lists) as one state.
+
+        :param board: current board, in its canonical form
+
+        :returns: (representative, permutation): the board that stands for all
+                       the symmetries of board, the same for each of them, and
+                       the permutation that maps a policy vector for the
+                       representative back to board:
+                       pi = representative_pi[permutation].
+                       Games without symmetries return (board, None).
+        """
+        return board, None
+
     def stringRepresentation(self, board: Board) -> str:
         """
 
@@ -107,3 +189,34 @@ class Game():
                          Required by MCTS for hashing.
         """
         pass
+
+    def getStateKey(self, board: Board) -> Hashable:
+        """
+        Optional. The key MCTS stores the state under. Defaults to
+        stringRepresentation; games can return a cheaper key, like an
+        integer Zobrist hash (see alpha_zero/Zobrist.py).
+
+        :param board: current board, in its canonical form
+
+        :returns: a hashable key, equal for equal boards
+        """
+        return self.stringRepresentation(board)
+
+    def getNextCanonicalState(self, board: Board, action: int, key: Hashable) -> Tuple[Board, Hashable]:
+        """
+        Optional. The step MCTS takes while descending the tree: player 1
+        plays action on the canonical board, and the result is returned in the
+        canonical form of the player who moves next, together with its key.
+        Games with an incremental key update it here instead of computing
+        getStateKey of the new board from scratch.
+
+        :param board: current board, in its canonical form
+        :param action: action taken by player 1
+        :param key: getStateKey(board)
+
+        :returns: (nextBoard, nextKey): the canonical form of the next board
+                       and getStateKey(nextBoard)
+        """
+        next_board, next_player = self.getNextState(board, 1, action)
+        next_board = self.getCanonicalForm(next_board, next_player)
+        return next_board, self.getStateKey(next_board)
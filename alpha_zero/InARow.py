@@ -0,0 +1,72 @@
+from typing import List
+
+import numpy as np
+
+
+class InARow():
+    """
+    Finds rows of length stones of one color on an n x n board with 1, -1
+    and 0 (empty) cells, horizontally, vertically or diagonally.
+
+    Every possible row is precomputed as the flat indices of its cells. A
+    row belongs to a color when its cells sum to +-length, so the whole
+    board is checked with one gather and one sum, without Python loops.
+    The rows through each cell are kept as well, so after a move only the
+    rows through the new stone need to be checked.
+    """
+
+    def __init__(self, n: int, length: int):
+        """
+        :param n: the board is n x n
+        :param length: the number of stones in a row that wins
+        """
+        self.n = n
+        self.length = length
+
+        windows = []
+        if length <= n:
+            # a row is its first cell plus length steps in its direction, the first
+            # cells are the ones the row fits from, x*n+y for x < rows and y < columns
+            steps = np.arange(length)
+            fits = n - length + 1
+            for rows, columns, first, step in ((n, fits, 0, 1),                      # horizontal
+                                               (fits, n, 0, n),                      # vertical
+                                               (fits, fits, 0, n + 1),               # diagonal
+                                               (fits, fits, length - 1, n - 1)):     # anti-diagonal
+                firsts = (np.arange(rows)[:, np.newaxis] * n + np.arange(columns)).ravel() + first
+                windows.append(firsts[:, np.newaxis] + steps * step)
+        self.windows = np.concatenate(windows) if windows else np.zeros((0, length), dtype=np.intp)
+        '''windows[i]: the flat indices of the cells of row i'''
+
+        windows_of_cell: List[List[int]] = [[] for _ in range(n * n)]
+        for window, window_cells in enumerate(self.windows.tolist()):
+            for cell in window_cells:
+                windows_of_cell[cell].append(window)
+        self.cell_windows = [self.windows[np.array(windows, dtype=np.intp)] for windows in windows_of_cell]
+        '''cell_windows[cell]: the rows that contain cell, as flat indices of their cells'''
+
+    def winner(self, board: np.ndarray) -> int:
+        '''
+        :param board: the board
+        :return: 1 or -1 if that color has a row, 0 if no one has
+        '''
+        sums = np.asarray(board).ravel()[self.windows].sum(axis=1)
+        if (sums == self.length).any():
+            return 1
+        if (sums == -self.length).any():
+            return -1
+        return 0
+
+    def wins_through(self, board: np.ndarray, x: int, y: int) -> bool:
+        '''
+        :param board: the board
+        :param x: column of a stone
+        :param y: row of the stone
+        :return: True if the stone on (x,y) is part of a row
+        '''
+        board = np.asarray(board).ravel()
+        stone = board[x * self.n + y]
+        if stone == 0:
+            return False
+        sums = board[self.cell_windows[x * self.n + y]].sum(axis=1)
+        return bool((sums == stone * self.length).any())
@@ -0,0 +1,263 @@
+import queue
+import threading
+import time
+from typing import Tuple
+
+import numpy as np
+
+from alpha_zero.Board import Board
+from alpha_zero.Game import Game
+from alpha_zero.NeuralNet import NeuralNet
+
+
+class InferenceServer():
+    """
+    Evaluates the boards of the searches of many self-play processes with one
+    neural network, so the processes do not need a copy of the network each,
+    and the network gets batches instead of single boards.
+
+    Every process has a slot in a block of shared memory (a RawArray of the
+    multiprocessing context) with room for max_batch_size boards, policies
+    and values. A process writes its boards to its slot and puts (slot,
+    number of boards) on the request queue. The server thread takes requests
+    off the queue until the next one would not fit in max_batch_size boards
+    or max_wait seconds have passed since the first one, evaluates them with
+    one nnet.predict_batch call, writes the results back to the slots and
+    wakes up the processes.
+
+    If nnet.predict_batch raises, the server keeps the exception in failure
+    and from then on wakes up every process that sends a request without
+    evaluating its boards. The processes raise a RuntimeError then, see
+    check for the exception of the server.
+
+    The server runs as a thread of the process that holds the network, which
+    is otherwise idle while the workers play. The processes reach it through
+    the RemoteNeuralNet returned by client(), which must be handed to them
+    when they are started, e.g. as an argument of a multiprocessing Pool
+    initializer.
+
+    nnet.predict_batch is called on the server thread, not on the thread that
+    built the network. The Keras networks therefore enter the graph of their
+    model before they predict.
+    """
+
+    def __init__(self, game: Game, nnet: NeuralNet, clients: int, context,
+                 max_batch_size: int = 64, max_wait: float = 0.001):
+        """
+        :param game: the game, for the sizes of the boards and policies
+        :param nnet: the network that evaluates the boards
+        :param clients: number of processes that use the server
+        :param context: the multiprocessing context the processes are started with
+        :param max_batch_size: most boards in one batch, and in one request
+        :param max_wait: seconds to wait for more requests once one has arrived
+        """
+        self.nnet = nnet
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        board = np.asarray(game.getInitBoard())
+        self.layout = SharedLayout(clients=clients,
+                                   capacity=max_batch_size,
+                                   board_shape=board.shape,
+                                   board_dtype=board.dtype.str,
+                                   policy_size=game.getPolicySize())
+        self.memory = context.RawArray('b', self.layout.size())
+        self.boards, self.pis, self.vs = self.layout.views(self.memory)
+
+        self.requests = context.Queue()
+        '''(slot, number of boards) of the processes waiting for results, None stops the server'''
+
+        self.done = [context.Semaphore(0) for _ in range(clients)]
+        '''done[slot] is released when the results of slot are ready'''
+
+        self.slots = context.Queue()
+        '''the free slots, a process takes one the first time it calls the server'''
+        for slot in range(clients):
+            self.slots.put(slot)
+
+        self.failed = context.RawValue('b', 0)
+        '''set when the server failed, the results of the slots are not valid then'''
+
+        self.failure = None
+        '''the exception nnet.predict_batch raised'''
+
+        self.batches = 0
+        self.evaluated = 0
+        self.thread = threading.Thread(target=self._serve, name='InferenceServer', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def close(self):
+        '''
+        Stop the server thread and release the shared memory
+        '''
+        if self.thread.is_alive():
+            self.requests.put(None)
+            self.thread.join()
+        del self.boards, self.pis, self.vs
+        self.memory = None
+
+    def check(self):
+        '''
+        Raise the exception that made the server fail, if it did
+        '''
+        if self.failure is not None:
+            raise self.failure
+
+    def client(self) -> 'RemoteNeuralNet':
+        '''
+        :return: a NeuralNet for one process, that evaluates its boards with this server
+        '''
+        return RemoteNeuralNet(self.memory, self.layout, self.requests, self.done, self.slots, self.failed)
+
+    def _serve(self):
+        carried = None
+        while True:
+            request = carried if carried is not None else self.requests.get()
+            carried = None
+            if request is None:
+                return
+            batch = [request]
+            size = request[1]
+
+            # collect more requests while the batch has room
+            stop = False
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                if size + request[1] > self.max_batch_size:
+                    # the next batch starts with it
+                    carried = request
+                    break
+                batch.append(request)
+                size += request[1]
+
+            if self.failure is None:
+                try:
+                    self._evaluate(batch)
+                except Exception as e:
+                    print("InferenceServer failed: " + repr(e))
+                    self.failure = e
+                    self.failed.value = 1
+
+            for slot, _ in batch:
+                self.done[slot].release()
+            if stop:
+                return
+
+    def _evaluate(self, batch):
+        boards = np.concatenate([self.boards[slot, :count] for slot, count in batch])
+        pis, vs = self.nnet.predict_batch(boards)
+        vs = np.reshape(vs, len(boards))
+
+        start = 0
+        for slot, count in batch:
+            self.pis[slot, :count] = pis[start:start + count]
+            self.vs[slot, :count] = vs[start:start + count]
+            start += count
+
+        self.batches += 1
+        self.evaluated += len(boards)
+
+
+class SharedLayout():
+    """
+    The arrays of the InferenceServer's shared memory block: for every slot,
+    capacity boards, policies and values, one after the other.
+    """
+
+    def __init__(self, clients: int, capacity: int, board_shape: Tuple[int, ...], board_dtype: str,
+                 policy_size: int):
+        self.clients = clients
+        self.capacity = capacity
+        self.board_shape = tuple(board_shape)
+        self.board_dtype = board_dtype
+        self.policy_size = policy_size
+
+    def _shapes(self):
+        return [((self.clients, self.capacity) + self.board_shape, np.dtype(self.board_dtype)),
+                ((self.clients, self.capacity, self.policy_size), np.dtype(np.float32)),
+                ((self.clients, self.capacity), np.dtype(np.float32))]
+
+    def size(self) -> int:
+        '''
+        :return: the number of bytes of the block
+        '''
+        return sum(int(np.prod(shape)) * dtype.itemsize for shape, dtype in self._shapes())
+
+    def views(self, buffer) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''
+        :param buffer: the memory of the block
+        :return: (boards, pis, vs), numpy arrays on buffer
+        '''
+        views = []
+        offset = 0
+        for shape, dtype in self._shapes():
+            views.append(np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset))
+            offset += int(np.prod(shape)) * dtype.itemsize
+        return tuple(views)
+
+
+class RemoteNeuralNet(NeuralNet):
+    """
+    The NeuralNet of a self-play process, which has its boards evaluated by
+    an InferenceServer in another process. Get it from InferenceServer.client().
+
+    It only predicts: training and checkpoints are left to the process that
+    holds the network.
+    """
+
+    def __init__(self, memory, layout: SharedLayout, requests, done, slots, failed):
+        self.memory = memory
+        '''the shared memory block, a RawArray that can only be handed to a process when it is started'''
+
+        self.layout = layout
+        self.requests = requests
+        self.done = done
+        self.slots = slots
+        self.failed = failed
+
+        self.slot = None
+        '''the slot of this process, taken on the first prediction'''
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['slot'] = None
+        for name in ('boards', 'pis', 'vs'):
+            state.pop(name, None)
+        return state
+
+    def predict(self, board: Board) -> Tuple[np.ndarray, float]:
+        pis, vs = self.predict_batch(np.asarray(board)[np.newaxis])
+        return pis[0], vs[0]
+
+    def predict_batch(self, boards: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self.slot is None:
+            self._attach()
+
+        pis = np.empty((len(boards), self.layout.policy_size), dtype=np.float32)
+        vs = np.empty(len(boards), dtype=np.float32)
+        for start in range(0, len(boards), self.layout.capacity):
+            count = min(self.layout.capacity, len(boards) - start)
+            self.boards[self.slot, :count] = boards[start:start + count]
+            self.requests.put((self.slot, count))
+            self.done[self.slot].acquire()
+            if self.failed.value:
+                raise RuntimeError("The InferenceServer failed to evaluate the boards")
+            pis[start:start + count] = self.pis[self.slot, :count]
+            vs[start:start + count] = self.vs[self.slot, :count]
+        return pis, vs
+
+    def _attach(self):
+        self.slot = self.slots.get()
+        self.boards, self.pis, self.vs = self.layout.views(self.memory)
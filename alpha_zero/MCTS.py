@@ -1,16 +1,22 @@
 import math
-from typing import List
+from typing import Hashable, List, Tuple
 
 import numpy as np
 
 from alpha_zero.Game import Game
 from alpha_zero.NeuralNet import NeuralNet
 from alpha_zero.Board import Board
+from alpha_zero.NodeTable import NodeTable
 
 
 class MCTS():
     """
     This class handles the MCTS tree.
+
+    The statistics of the tree are kept in a NodeTable, where every state seen
+    by the search has an integer node id and every expanded state has an edge
+    row, with the per edge statistics (N, W, P) in numpy arrays of length
+    game.getActionSize(). Q is computed as W/N when an action is selected.
     """
 
     def __init__(self, game: Game, neural_net: NeuralNet, args):
@@ -18,40 +24,82 @@ class MCTS():
         self.nnet = neural_net
         self.cpuct = args.cpuct
         self.numMCTSSims = args.numMCTSSims
+        self.action_size = self.game.getActionSize()
 
-        self.expected_reward_for_state_and_action = {}
-        '''Qsa. stores Q values for s(tate),a(ction) (as defined in the paper)'''
+        self.batch_size = args.get('mctsBatchSize', 1)
+        '''number of leaves collected with virtual loss before they are evaluated in one network call'''
 
-        self.edge_visited = {}
-        '''Nsa. stores #times edge s(tate),a(ction) was visited'''
+        self.virtual_loss = args.get('mctsVirtualLoss', 1)
+        '''number of lost visits added to an edge while a simulation through it is pending'''
 
-        self.state_visited = {}
-        '''Na. stores #times board s(tate) was visited'''
+        self.reuse_tree = args.get('mctsReuseTree', False)
+        '''keep the subtree below the new root between moves and release the rest of the tree'''
 
-        self.policy = {}
-        '''Ps. stores initial policy (returned by neural net)'''
+        self.use_symmetries = args.get('mctsSymmetries', False)
+        '''store all symmetries of a board as one state, using game.getCanonicalSymmetry'''
 
-        self.end_states = {}
-        """Es. stores game.getGameEnded ended for board s(tate)"""
+        self.nodes = NodeTable(self.action_size,
+                               max_nodes=args.get('mctsMaxNodes'),
+                               eviction_policy=args.get('mctsEvictionPolicy', 'lru'),
+                               max_bytes=args.get('mctsMaxBytes'))
+        '''the search tree. Ns and Es indexed by node id, Nsa, Wsa, Ps and Vs by edge row'''
 
-        self.valid_moves_for_state = {}
-        """Vs. stores game.getValidMoves for board s(tate)"""
+        self._path_nodes = np.zeros(64, dtype=np.intp)
+        self._path_actions = np.zeros(64, dtype=np.intp)
+        self._signs = np.where(np.arange(64) % 2 == 0, 1.0, -1.0)
 
     def getActionProb(self, canonicalBoard: Board, temperature=1) -> List[float]:
         """
         This function performs numMCTSSims simulations of MCTS starting from
         canonicalBoard.
 
+        If args.mctsBatchSize is larger than 1, the simulations are run in
+        batches of that size with search_batch, so only about
+        numMCTSSims/mctsBatchSize network calls are made.
+
+        If args.mctsReuseTree is set, the nodes that can not be reached from
+        canonicalBoard are released first. The statistics below canonicalBoard,
+        gathered while searching earlier moves of the game, are kept, so the
+        simulations start from a tree that is already partly built, and the
+        tree does not grow over the course of a game.
+
+        If args.mctsMaxNodes is set, the tree is kept below that many nodes by
+        evicting nodes by args.mctsEvictionPolicy, 'lru' (default) or 'visits'.
+        args.mctsMaxBytes bounds the tree by the size of its arrays instead,
+        see NodeTable.bytes_per_node.
+        self.nodes.summary() reports the lookup and eviction counts.
+
+        If args.mctsSymmetries is set, the search runs on the representative
+        of the board's symmetries (game.getCanonicalSymmetry), so symmetric
+        positions share their statistics and neural net evaluation. The visit
+        counts are mapped back to canonicalBoard's actions.
+
         :returns: action policy vector where the probability of the ith action is proportional to Nsa[(state,action)]**(1./temperature)
         """
-        for i in range(self.numMCTSSims):
-            self.search(canonicalBoard)
+        permutation = None
+        if self.use_symmetries:
+            canonicalBoard, permutation = self.game.getCanonicalSymmetry(canonicalBoard)
 
-        state = self.game.stringRepresentation(canonicalBoard)
+        # every simulation starts from the same root, its representative and key are computed once
+        root = (canonicalBoard, self.game.getStateKey(canonicalBoard))
 
-        visits_per_action = [self.edge_visited[(state, action)]
-                  if (state, action) in self.edge_visited else 0
-                  for action in range(self.game.getActionSize())]
+        if self.reuse_tree:
+            self.nodes.retain(self._get_node(*root))
+
+        if self.batch_size > 1:
+            self._search_batches(canonicalBoard, root)
+        else:
+            for i in range(self.numMCTSSims):
+                self.search(canonicalBoard, root)
+
+        row = self.nodes.edge_rows[self._get_node(*root)]
+
+        if row < 0:
+            visits_per_action = np.zeros(self.action_size)
+        else:
+            visits_per_action = self.nodes.edge_visited[row]
+        if permutation is not None:
+            visits_per_action = visits_per_action[permutation]
 
         # If cold, only the best action is available
         if temperature == 0:
@@ -61,133 +109,304 @@ class MCTS():
             return probs
 
         # At higher temps, increase probabilities
-        visits_per_action = [visits ** (1. / temperature) for visits in visits_per_action]
+        visits_per_action = visits_per_action ** (1. / temperature)
 
         # Then normalise
-        sum_of_visits = float(sum(visits_per_action))
-        probs = [visits / sum_of_visits for visits in visits_per_action]
+        sum_of_visits = float(np.sum(visits_per_action))
+        probs = visits_per_action / sum_of_visits
 
-        return probs
+        return probs.tolist()
 
-    def search(self, canonicalBoard: Board) -> float:
+    def search(self, canonicalBoard: Board, root: Tuple[Board, Hashable] = None) -> float:
         """
-        This function performs one iteration of MCTS. It is recursively called
-        till action leaf node is found. The action chosen at each node is one that
-        has the maximum upper confidence bound as in the paper.
+        This function performs one iteration of MCTS. It descends the tree from
+        canonicalBoard till a leaf node is found. The action chosen at each node is
+        one that has the maximum upper confidence bound as in the paper.
 
-        Once action leaf node is found, the neural network is called to return an
-        initial policy P and action value value for the state. This value is propogated
-        up the search path. In case the leaf node is action terminal state, the
+        Once a leaf node is found, the neural network is called to return an
+        initial policy P and a value for the state. This value is propogated
+        up the search path. In case the leaf node is a terminal state, the
         outcome is propogated up the search path. The values of Ns, Nsa, Qsa are
         updated.
 
+        The descent and the backup are loops over a path kept in preallocated
+        arrays, so deep games do not pay for a Python frame per ply and can not
+        hit the recursion limit.
+
         NOTE: the return values are the negative of the value of the current
         state. This is done since value is in [-1,1] and if value is the value of action
         state for the current player, then its value is -value for the other player.
 
         :param canonicalBoard: the board to start from
+        :param root: the representative of canonicalBoard and its state key, computed if not given
 
         :return: the negative of the value of the current canonicalBoard
         """
+        self.nodes.start_simulation()
+        depth, board, node = self._descend(root or self._representative(canonicalBoard), 0)
 
-        state = self.game.stringRepresentation(canonicalBoard)
-
-        # if gameEnded: return -gameReward
-        if state not in self.end_states:
-            self.end_states[state] = self.game.getGameEnded(canonicalBoard, 1)
-        if self.end_states[state] != 0:
+        if self.nodes.end_states[node] != 0:
             # terminal node
-            return -self.end_states[state]
-
-        # if not visited
-        if state not in self.policy:
-            return self._visit(canonicalBoard, state)
-
-        # Select the best action
-        action = self._select_best_action(state)
-
-        next_state, next_player = self.game.getNextState(canonicalBoard, 1, action)
-
-        next_state = self.game.getCanonicalForm(next_state, next_player)
-
-        value = self.search(next_state)
+            value = -self.nodes.end_states[node]
+        else:
+            # leaf node
+            value = self._visit(board, node)
 
-        if (state, action) in self.expected_reward_for_state_and_action:
-            exp_reward = self.expected_reward_for_state_and_action[(state, action)]
+        self._backup(self._path_nodes[:depth], self._path_actions[:depth], value, 0)
 
-            edge_visited = self.edge_visited[(state, action)]
+        # value is seen from the leaf's parent, flip it once per ply back to the root
+        return value if depth % 2 == 0 else -value
 
-            self.expected_reward_for_state_and_action[(state, action)] = (edge_visited * exp_reward + value) / (
-                    edge_visited + 1)
+    def _search_batches(self, canonicalBoard: Board, root: Tuple[Board, Hashable]):
+        '''
+        Perform numMCTSSims simulations from canonicalBoard in batches of self.batch_size
 
-            self.edge_visited[(state, action)] += 1
+        :param canonicalBoard: the board to start from
+        :param root: the representative of canonicalBoard and its state key
+        '''
+        simulations = self.numMCTSSims
+        if self.nodes.edge_rows[self._get_node(*root)] < 0 and simulations > 0:
+            # Every path of the first batch would end in the root, so evaluate it on its own
+            self.search(canonicalBoard, root)
+            simulations -= 1
+
+        while simulations > 0:
+            batch_size = min(self.batch_size, simulations)
+            self.search_batch(canonicalBoard, batch_size, root)
+            simulations -= batch_size
+
+    def search_batch(self, canonicalBoard: Board, batch_size: int, root: Tuple[Board, Hashable] = None):
+        """
+        This function performs batch_size iterations of MCTS, with a single
+        network call for all of them.
 
-        else:
-            self.expected_reward_for_state_and_action[(state, action)] = value
+        Each simulation descends from canonicalBoard like search does, but adds a
+        virtual loss to every edge it passes, so the following simulations of the
+        batch are steered to other paths. The leaves that need the neural network
+        are collected and evaluated with one batched prediction. Afterwards the
+        virtual losses are removed and the values are backed up along each path.
 
-            self.edge_visited[(state, action)] = 1
+        If two simulations end in the same unevaluated leaf, the leaf is evaluated
+        once and both paths get its value.
 
-        self.state_visited[state] += 1
+        :param canonicalBoard: the board to start from
+        :param batch_size: number of simulations
+        :param root: the representative of canonicalBoard and its state key, computed if not given
+        """
+        root = root or self._representative(canonicalBoard)
+        paths = []
+        leaf_boards = []
+        leaf_nodes = []
+        pending = {}
+
+        self.nodes.start_simulation()
+        for _ in range(batch_size):
+            depth, board, node = self._descend(root, self.virtual_loss)
+            path_nodes = self._path_nodes[:depth].copy()
+            path_actions = self._path_actions[:depth].copy()
+
+            if self.nodes.end_states[node] != 0:
+                # terminal node
+                paths.append((path_nodes, path_actions, -self.nodes.end_states[node], None))
+                continue
+
+            if node not in pending:
+                pending[node] = len(leaf_nodes)
+                leaf_boards.append(board)
+                leaf_nodes.append(node)
+            paths.append((path_nodes, path_actions, None, pending[node]))
+
+        values = []
+        if leaf_boards:
+            policies, vs = self.nnet.predict_batch(np.asarray(leaf_boards))
+            for board, node, policy, v in zip(leaf_boards, leaf_nodes, policies, vs):
+                self._expand(board, node, policy)
+                values.append(-float(np.squeeze(v)))
+
+        for path_nodes, path_actions, value, leaf in paths:
+            if value is None:
+                value = values[leaf]
+            self._backup(path_nodes, path_actions, value, self.virtual_loss)
+
+    def _descend(self, root: Tuple[Board, Hashable], virtual_loss: int):
+        '''
+        Follow the best actions from root to a terminal or unevaluated
+        node. The path is written to self._path_nodes and self._path_actions,
+        which are grown when the path does not fit.
 
-        return -value
+        :param root: the representative of the board to start from and its state key, see _representative
+        :param virtual_loss: number of lost visits to add to every edge on the path
+        :return: the length of the path, and the board and node id of the leaf
+        '''
+        nodes = self.nodes
+        depth = 0
+
+        board, key = root
+        node = self._get_node(board, key)
+        while nodes.end_states[node] == 0 and nodes.edge_rows[node] >= 0:
+            row = nodes.edge_rows[node]
+            action = self._select_best_action(node, row)
+
+            if virtual_loss:
+                nodes.edge_visited[row, action] += virtual_loss
+                nodes.total_reward[row, action] -= virtual_loss
+                nodes.state_visited[node] += virtual_loss
+
+            if depth == len(self._path_nodes):
+                self._path_nodes = np.concatenate([self._path_nodes, np.zeros_like(self._path_nodes)])
+                self._path_actions = np.concatenate([self._path_actions, np.zeros_like(self._path_actions)])
+            self._path_nodes[depth] = node
+            self._path_actions[depth] = action
+            depth += 1
+
+            # the game updates the state key along with the board, where it can
+            next_board, next_key = self.game.getNextCanonicalState(board, action, key)
+            board, key = self._representative(next_board, next_key)
+            # the move tells the game where to look for the end, unless the board was turned into its representative
+            next_node = self._get_node(board, key, None if self.use_symmetries else action)
+            nodes.children[row, action] = next_node
+            node = next_node
+
+        return depth, board, node
+
+    def _backup(self, path_nodes: np.ndarray, path_actions: np.ndarray, value: float, virtual_loss: int):
+        '''
+        Add the value of a simulation to the edges of its path and remove the
+        virtual loss the descent put on them. A path never contains the same
+        edge twice, so the edges of long paths are updated at once with fancy
+        indexing.
+
+        :param path_nodes: the node ids of the path, from the root
+        :param path_actions: the action taken in each node of the path
+        :param value: the value of the leaf, seen from the player to move in the last node of the path
+        :param virtual_loss: the virtual loss that was added to every edge by _descend
+        '''
+        depth = len(path_nodes)
+        nodes = self.nodes
+
+        if depth < 16:
+            # short paths are cheaper to walk than to fancy index
+            for i in range(depth - 1, -1, -1):
+                node = path_nodes[i]
+                row = nodes.edge_rows[node]
+                action = path_actions[i]
+                nodes.total_reward[row, action] += virtual_loss + value
+                nodes.edge_visited[row, action] += 1 - virtual_loss
+                nodes.state_visited[node] += 1 - virtual_loss
+                value = -value
+            return
+
+        # the sign of the value flips once per ply going up
+        values = value * self._alternating_signs(depth)
+        edge = (nodes.edge_rows[path_nodes], path_actions)
+
+        nodes.total_reward[edge] += virtual_loss + values
+        nodes.edge_visited[edge] += 1 - virtual_loss
+
+        nodes.state_visited[path_nodes] += 1 - virtual_loss
+
+    def _alternating_signs(self, depth: int) -> np.ndarray:
+        '''
+        :param depth: the length of a path
+        :return: the sign of the leaf value for every edge of the path, +1 on the last edge
+        '''
+        if depth > len(self._signs):
+            self._signs = np.where(np.arange(2 * depth) % 2 == 0, 1.0, -1.0)
+        return self._signs[depth - 1::-1]
 
-    def _select_best_action(self, state: str) -> int:
+    def _representative(self, canonicalBoard: Board, key: Hashable = None) -> Tuple[Board, Hashable]:
+        '''
+        :param canonicalBoard: the board
+        :param key: game.getStateKey(canonicalBoard), if it is known
+        :return: the board the search stores canonicalBoard as, and its state key
+        '''
+        if self.use_symmetries:
+            canonicalBoard, _ = self.game.getCanonicalSymmetry(canonicalBoard)
+            # the key of the representative can not be derived from the key of the board
+            key = None
+        if key is None:
+            key = self.game.getStateKey(canonicalBoard)
+        return canonicalBoard, key
+
+    def _get_node(self, canonicalBoard: Board, key: Hashable = None, action: int = None) -> int:
+        '''
+        :param canonicalBoard: the board
+        :param key: game.getStateKey(canonicalBoard), computed if not given
+        :param action: the action that was played to reach canonicalBoard, if it is known
+        :return: the node id of the board, a new node is added if the board has not been seen before
+        '''
+        state = key if key is not None else self.game.getStateKey(canonicalBoard)
+
+        node = self.nodes.get(state)
+        if node is None:
+            if action is None:
+                end_state = self.game.getGameEnded(canonicalBoard, 1)
+            else:
+                end_state = self.game.getGameEndedAfterMove(canonicalBoard, 1, action)
+            node = self.nodes.add(state, end_state)
+        return node
+
+    def _select_best_action(self, node: int, row: int) -> int:
         '''
         Select the action that maximises the upper confidence bounds on expected reward for this game state
 
-        :param state: the game state
+        The bounds of all actions are computed in one numpy expression over the
+        edge row of the node table. Qsa is Wsa/Nsa, and 0 for the edges that
+        were not visited yet. Invalid actions are masked with -inf, and ties
+        are broken towards the lowest action number by np.argmax.
+
+        :param node: the node id of the game state
+        :param row: the edge row of the node
         :return: action: The action (number)
         '''
-        valid_moves = self.valid_moves_for_state[state]
-        current_best = -float('inf')
-        best_action = -1
-        # pick the action with the highest upper confidence bound
-        for action in range(self.game.getActionSize()):
-            if valid_moves[action]:
-
-                policy = self.policy[state][action]
-                sqrt_visited = math.sqrt(self.state_visited[state])
-                edge_visited = self.edge_visited[(state, action)] if (state, action) in self.edge_visited else 0
-
-                if (state, action) in self.expected_reward_for_state_and_action:
-                    expected_reward = self.expected_reward_for_state_and_action[(state, action)]
-                else:
-                    expected_reward = 0
-
-                upper_confidence_bounds_on_expected_reward = \
-                    expected_reward + self.cpuct * policy * sqrt_visited / (1 + edge_visited)
-
-                if upper_confidence_bounds_on_expected_reward > current_best:
-                    current_best = upper_confidence_bounds_on_expected_reward
-                    best_action = action
-        action = best_action
+        nodes = self.nodes
+        sqrt_visited = math.sqrt(nodes.state_visited[node])
+        edge_visited = nodes.edge_visited[row]
+        expected_reward = nodes.total_reward[row] / np.maximum(edge_visited, 1)
+
+        upper_confidence_bounds_on_expected_reward = \
+            expected_reward + self.cpuct * nodes.policy[row] * sqrt_visited / (1 + edge_visited)
+
+        # pick the valid action with the highest upper confidence bound
+        upper_confidence_bounds_on_expected_reward = np.where(nodes.valid_moves[row],
+                                                              upper_confidence_bounds_on_expected_reward,
+                                                              -np.inf)
+        action = int(np.argmax(upper_confidence_bounds_on_expected_reward))
         return action
 
-    def _visit(self, canonicalBoard: Board, state: str) -> float:
+    def _visit(self, canonicalBoard: Board, node: int) -> float:
         # Means this is a leaf node
 
         # Predict the policy and value for this board state
-        self.policy[state], v = self.nnet.predict(canonicalBoard)
+        policy, v = self.nnet.predict(canonicalBoard)
+
+        self._expand(canonicalBoard, node, policy)
+        return -float(np.squeeze(v))
 
+    def _expand(self, canonicalBoard: Board, node: int, policy: np.ndarray):
+        '''
+        Mask the predicted policy with the valid moves and store it in the node
+
+        :param canonicalBoard: the board of the node
+        :param node: the node id
+        :param policy: the policy predicted by the neural network
+        '''
         # Mask invalid moves
-        self.valid_moves_for_state[state] = self.game.getValidMoves(canonicalBoard, 1)  # Fixed size boolean vector,
-        self.policy[state] = self.policy[state] * self.valid_moves_for_state[
-            state]  # So the policy for the invalid set to 0
+        valid_moves = self.game.getValidMoves(canonicalBoard, 1)  # Fixed size boolean vector,
+        policy = self.game.expandPolicy(policy, valid_moves)  # So the policy for the invalid set to 0
 
         # Sum the remaining moves
-        sum_policy_for_state = np.sum(self.policy[state])
+        sum_policy_for_state = np.sum(policy)
 
         if sum_policy_for_state > 0:
             # renormalize
-            self.policy[state] /= sum_policy_for_state
+            policy /= sum_policy_for_state
         else:
             # if all valid moves were masked make all valid moves equally probable
 
             # NB! All valid moves may be masked if either your NNet architecture is insufficient or you've get overfitting or something else.
             # If you have got dozens or hundreds of these messages you should pay attention to your NNet and/or training process.
             print("All valid moves were masked, do workaround.")
-            self.policy[state] = self.policy[state] + self.valid_moves_for_state[state]
-            self.policy[state] /= np.sum(self.policy[state])
+            policy = valid_moves / np.sum(valid_moves)
 
-        self.state_visited[state] = 0
-        return -v
+        self.nodes.expand(node, policy, valid_moves)
@@ -0,0 +1,30 @@
+import numpy as np
+
+from alpha_zero.Board import Board
+from alpha_zero.Game import Game
+from alpha_zero.MCTS import MCTS
+from alpha_zero.NeuralNet import NeuralNet
+from alpha_zero.Player import Player
+
+
+class MCTSPlayer(Player):
+    """
+    Plays the most visited action of an MCTS search with the given network,
+    with a new search tree every game.
+
+    Unlike a lambda around MCTS.getActionProb it can be built by a picklable
+    function in another process, see the players of Arena.play_games.
+    """
+
+    def __init__(self, name, game: Game, nnet: NeuralNet, args):
+        super().__init__(name)
+        self.game = game
+        self.nnet = nnet
+        self.args = args
+        self.mcts = MCTS(game, nnet, args)
+
+    def reset(self):
+        self.mcts = MCTS(self.game, self.nnet, self.args)
+
+    def play(self, board: Board):
+        return np.argmax(self.mcts.getActionProb(board, temperature=0))
@@ -1,8 +1,9 @@
-from typing import List, Tuple
+from typing import List, Tuple, Union
 
 import numpy as np
 
 from alpha_zero.Board import Board
+from alpha_zero.ExampleSampler import ExampleSampler
 
 
 class NeuralNet():
@@ -18,15 +19,17 @@ class NeuralNet():
     def __init__(self, game):
         pass
 
-    def train(self, examples: List[Tuple[Board,List[float],List[int]]]):
+    def train(self, examples: Union[ExampleSampler, List[Tuple[Board,List[float],List[int]]]]):
         """
         This function trains the neural network with examples obtained from
         self-play.
 
-        :param examples: a list of training examples, where each example is of form
+        :param examples: the training examples, where each example is of form
                       (board, pi, v). pi is the MCTS informed policy vector for
                       the given board, and v is its value. The examples has
-                      board in its canonical form.
+                      board in its canonical form. Coach passes an
+                      ExampleSampler, which hands out shuffled float32 batches;
+                      ExampleSampler.of also accepts a list of examples.
         """
         pass
 
@@ -34,11 +37,27 @@ class NeuralNet():
         """
         :param board: current board in its canonical form.
 
-        :returns pi: a policy vector for the current board- a numpy array of length game.getActionSize
+        :returns pi: a policy vector for the current board- a numpy array of length game.getPolicySize
         :returns v: a float in [-1,1] that gives the value of the current board
         """
         pass
 
+    def predict_batch(self, boards: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Evaluates several boards at once. The default implementation calls
+        predict for each board; subclasses should override it with a single
+        call into their framework.
+
+        :param boards: a numpy array of boards in their canonical form, the first axis is the batch
+
+        :returns pis: a numpy array of shape (len(boards), game.getPolicySize) with the policy vectors
+        :returns vs: a numpy array of shape (len(boards),) with the values of the boards
+        """
+        predictions = [self.predict(board) for board in boards]
+        pis = np.array([pi for pi, _ in predictions])
+        vs = np.array([np.squeeze(v) for _, v in predictions])
+        return pis, vs
+
     def save_checkpoint(self, folder: str, filename:str):
         """
         Saves the current neural network (with its parameters) in
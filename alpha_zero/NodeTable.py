@@ -0,0 +1,332 @@
+from typing import Dict, Hashable, List, Optional
+
+import numpy as np
+
+
+class NodeTable():
+    """
+    Storage for the MCTS tree. Every state seen by the search gets an integer
+    node id, and the statistics of the state are kept in contiguous numpy
+    arrays indexed by that id.
+
+    The statistics of the edges of a state, a value per action, only exist
+    once the neural net has been asked about it, so they are kept apart: a
+    node that is expanded gets an edge row, and edge_rows maps the node id to
+    it. Leaves and terminal states take no room for their edges. Qsa is not
+    stored, it is Wsa/Nsa, and the edge statistics are kept in 32 bits.
+
+    The arrays grow by doubling when they are full, so the amortised cost of
+    adding a node is constant. Nodes dropped by retain are put on a free list
+    and their ids and edge rows are handed out again by add and expand.
+
+    With max_nodes set, or max_bytes, which is turned into a number of nodes
+    with bytes_per_node, the arrays are allocated once for that many nodes
+    and never grow. When the table is full, add evicts the eighth of the nodes that were least recently visited
+    ('lru') or have the fewest visits ('visits'). A node is never visited more
+    often or more recently than its parent, except through transpositions, so
+    both policies drop the bottoms of the least interesting subtrees first.
+    Nodes used by the running simulation are never evicted. If the table is
+    full with those alone, add raises a RuntimeError rather than growing.
+    """
+
+    EVICTION_POLICIES = ('lru', 'visits')
+
+    def __init__(self, action_size: int, capacity: int = 1024, max_nodes: int = None, eviction_policy: str = 'lru',
+                 max_bytes: int = None):
+        """
+        :param action_size: number of actions per state, game.getActionSize()
+        :param capacity: number of nodes to allocate room for up front
+        :param max_nodes: maximum number of nodes to keep, None for no limit
+        :param eviction_policy: which nodes to evict when the table is full, 'lru' or 'visits'
+        :param max_bytes: maximum size of the arrays of the table, None for no limit. The smaller
+                          of max_nodes and max_bytes applies when both are given
+        """
+        if eviction_policy not in self.EVICTION_POLICIES:
+            raise ValueError("Unknown eviction policy {}, use one of {}".format(eviction_policy, self.EVICTION_POLICIES))
+
+        if max_bytes:
+            nodes_in_bytes = max(1, max_bytes // self.bytes_per_node(action_size))
+            max_nodes = min(max_nodes, nodes_in_bytes) if max_nodes else nodes_in_bytes
+
+        self.action_size = action_size
+        self.max_nodes = max_nodes
+        self.eviction_policy = eviction_policy
+        if max_nodes:
+            # a bounded table is allocated once, growing would copy it and hold both copies for a while
+            capacity = max_nodes
+
+        self.capacity = 0
+        self.size = 0
+        '''number of node ids handed out, including the ones on the free list'''
+
+        self.free_nodes: List[int] = []
+        '''node ids released by retain, ready to be reused'''
+
+        self.node_ids: Dict[Hashable, int] = {}
+        '''maps the state key (game.getStateKey) to the node id'''
+
+        self.keys: List[Optional[Hashable]] = []
+        '''the state key of each node id'''
+
+        self.state_visited = np.zeros(0, dtype=np.int32)
+        '''Ns. stores #times the state was visited'''
+
+        self.end_states = np.zeros(0, dtype=np.float64)
+        """Es. stores game.getGameEnded for the state"""
+
+        self.edge_rows = np.zeros(0, dtype=np.int32)
+        '''the edge row of the node, -1 until the neural net has been asked about the state'''
+
+        self.last_visited = np.zeros(0, dtype=np.int64)
+        '''the value of self.clock when the node was last looked up'''
+
+        self.edge_capacity = 0
+        self.edge_size = 0
+        '''number of edge rows handed out, including the ones on the free list'''
+
+        self.free_edge_rows: List[int] = []
+        '''edge rows of released nodes, ready to be reused'''
+
+        self.edge_visited = np.zeros((0, action_size), dtype=np.int32)
+        '''Nsa. stores #times edge s(tate),a(ction) was visited, indexed by edge row'''
+
+        self.total_reward = np.zeros((0, action_size), dtype=np.float32)
+        '''Wsa. sum of the values backed up through edge s(tate),a(ction), Qsa is Wsa/Nsa'''
+
+        self.policy = np.zeros((0, action_size), dtype=np.float32)
+        '''Ps. stores initial policy (returned by neural net)'''
+
+        self.valid_moves = np.zeros((0, action_size), dtype=np.bool_)
+        """Vs. stores game.getValidMoves for the state"""
+
+        self.children = np.zeros((0, action_size), dtype=np.int32)
+        '''node id reached by edge s(tate),a(ction), -1 until the edge has been followed'''
+
+        self.clock = 0
+        '''counts the lookups, used to order the nodes by recency'''
+
+        self.protected_from = 0
+        '''nodes looked up at or after this clock belong to the running simulation'''
+
+        self.hits = 0
+        '''number of lookups that found their state'''
+
+        self.misses = 0
+        '''number of lookups that did not find their state'''
+
+        self.evictions = 0
+        '''number of nodes evicted because the table was full'''
+
+        self._grow(capacity)
+        self._grow_edges(capacity)
+
+    @staticmethod
+    def bytes_per_node(action_size: int) -> int:
+        '''
+        :param action_size: number of actions per state
+        :return: the bytes of array room a node takes with its edge row, the
+                 state keys and their dictionary come on top
+        '''
+        # state_visited, end_states, edge_rows, last_visited
+        node = 4 + 8 + 4 + 8
+        # edge_visited, total_reward, policy, valid_moves, children
+        edge = 4 + 4 + 4 + 1 + 4
+        return node + action_size * edge
+
+    def nbytes(self) -> int:
+        '''
+        :return: the bytes allocated for the arrays of the table
+        '''
+        return sum(array.nbytes for array in (self.state_visited, self.end_states, self.edge_rows, self.last_visited,
+                                              self.edge_visited, self.total_reward, self.policy, self.valid_moves,
+                                              self.children))
+
+    def __len__(self) -> int:
+        return self.size - len(self.free_nodes)
+
+    def __contains__(self, state: Hashable) -> bool:
+        return state in self.node_ids
+
+    def get(self, state: Hashable) -> Optional[int]:
+        '''
+        :param state: the state key
+        :return: the node id of the state, or None if the state is not in the table
+        '''
+        node = self.node_ids.get(state)
+        self.clock += 1
+        if node is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.last_visited[node] = self.clock
+        return node
+
+    def start_simulation(self):
+        '''
+        Mark the start of a simulation (or of a batch of them). The nodes looked
+        up from now on can not be evicted until the next call.
+        '''
+        self.protected_from = self.clock + 1
+
+    def add(self, state: Hashable, end_state: float) -> int:
+        '''
+        Allocate a node for a state not seen before
+
+        :param state: the state key
+        :param end_state: game.getGameEnded for the state
+        :return: the node id of the new node
+        '''
+        if not self.free_nodes and self.max_nodes and self.size >= self.max_nodes:
+            if not self.evict(max(1, self.max_nodes // 8)):
+                raise RuntimeError("The node table is full with the {} nodes of the running simulation, "
+                                   "allow more nodes than that".format(self.size))
+
+        if self.free_nodes:
+            node = self.free_nodes.pop()
+            self.keys[node] = state
+        else:
+            if self.size == self.capacity:
+                self._grow(2 * self.capacity)
+            node = self.size
+            self.size += 1
+            self.keys.append(state)
+
+        self.node_ids[state] = node
+        self.end_states[node] = end_state
+        self.clock += 1
+        self.last_visited[node] = self.clock
+        return node
+
+    def expand(self, node: int, policy: np.ndarray, valid_moves: np.ndarray):
+        '''
+        Store the neural net evaluation of a node in a new edge row
+
+        :param node: the node id
+        :param policy: the masked and normalised policy for the state
+        :param valid_moves: game.getValidMoves for the state
+        :return: the edge row of the node
+        '''
+        if self.free_edge_rows:
+            row = self.free_edge_rows.pop()
+        else:
+            if self.edge_size == self.edge_capacity:
+                self._grow_edges(2 * self.edge_capacity)
+            row = self.edge_size
+            self.edge_size += 1
+
+        self.policy[row] = policy
+        self.valid_moves[row] = valid_moves
+        self.edge_rows[node] = row
+        return row
+
+    def retain(self, root: int) -> int:
+        '''
+        Release every node that can not be reached from root by following the
+        recorded children. The statistics of the nodes that are kept are not
+        touched, so a subtree searched on an earlier move carries over.
+
+        :param root: the node id of the new root
+        :return: the number of nodes released
+        '''
+        reachable = np.zeros(self.size, dtype=np.bool_)
+        reachable[root] = True
+        frontier = np.array([root])
+        while frontier.size:
+            rows = self.edge_rows[frontier]
+            children = self.children[rows[rows >= 0]].ravel()
+            children = np.unique(children[children >= 0])
+            children = children[~reachable[children]]
+            reachable[children] = True
+            frontier = children
+
+        live = np.ones(self.size, dtype=np.bool_)
+        live[self.free_nodes] = False
+        released = np.flatnonzero(live & ~reachable)
+
+        self._release(released)
+        return len(released)
+
+    def evict(self, number: int) -> int:
+        '''
+        Release up to number nodes, chosen by the eviction policy. Nodes of the
+        running simulation are kept.
+
+        :param number: the number of nodes to release
+        :return: the number of nodes released
+        '''
+        candidates = np.ones(self.size, dtype=np.bool_)
+        candidates[self.free_nodes] = False
+        candidates &= self.last_visited[:self.size] < self.protected_from
+        candidates = np.flatnonzero(candidates)
+        if len(candidates) > number:
+            if self.eviction_policy == 'visits':
+                # fewest visits first, least recently visited among equals
+                order = np.lexsort((self.last_visited[candidates], self.state_visited[candidates]))
+                candidates = candidates[order[:number]]
+            else:
+                candidates = candidates[np.argpartition(self.last_visited[candidates], number)[:number]]
+
+        # the parents of evicted nodes must not point to the ids when they are handed out again,
+        # a missing child (-1) looks up the extra last entry, which stays False
+        evicted = np.zeros(self.size + 1, dtype=np.bool_)
+        evicted[candidates] = True
+        children = self.children[:self.edge_size]
+        children[evicted[children]] = -1
+
+        self._release(candidates)
+        self.evictions += len(candidates)
+        return len(candidates)
+
+    def summary(self) -> str:
+        '''
+        :return: a one line report of the size and the lookup and eviction counts of the table
+        '''
+        lookups = max(self.hits + self.misses, 1)
+        return ('Nodes: {nodes}/{max} | Memory: {memory:.1f} MB | Hits: {hits} ({rate:.1%}) | Misses: {misses} | '
+                'Evictions: {evictions}').format(
+            nodes=len(self),
+            max=self.max_nodes if self.max_nodes else 'unbounded',
+            memory=self.nbytes() / 2 ** 20,
+            hits=self.hits,
+            rate=self.hits / lookups,
+            misses=self.misses,
+            evictions=self.evictions)
+
+    def _release(self, released: np.ndarray):
+        for node in released.tolist():
+            del self.node_ids[self.keys[node]]
+            self.keys[node] = None
+        self.free_nodes.extend(released.tolist())
+
+        rows = self.edge_rows[released]
+        rows = rows[rows >= 0]
+        self.free_edge_rows.extend(rows.tolist())
+        self.edge_visited[rows] = 0
+        self.total_reward[rows] = 0
+        self.policy[rows] = 0
+        self.valid_moves[rows] = False
+        self.children[rows] = -1
+
+        self.state_visited[released] = 0
+        self.end_states[released] = 0
+        self.edge_rows[released] = -1
+        self.last_visited[released] = 0
+
+    def _grow(self, capacity: int):
+        capacity = max(capacity, 1)
+        extra = capacity - self.capacity
+        self.state_visited = np.concatenate([self.state_visited, np.zeros(extra, dtype=np.int32)])
+        self.end_states = np.concatenate([self.end_states, np.zeros(extra, dtype=np.float64)])
+        self.edge_rows = np.concatenate([self.edge_rows, np.full(extra, -1, dtype=np.int32)])
+        self.last_visited = np.concatenate([self.last_visited, np.zeros(extra, dtype=np.int64)])
+        self.capacity = capacity
+
+    def _grow_edges(self, capacity: int):
+        capacity = max(capacity, 1)
+        edges = (capacity - self.edge_capacity, self.action_size)
+        self.edge_visited = np.concatenate([self.edge_visited, np.zeros(edges, dtype=np.int32)])
+        self.total_reward = np.concatenate([self.total_reward, np.zeros(edges, dtype=np.float32)])
+        self.policy = np.concatenate([self.policy, np.zeros(edges, dtype=np.float32)])
+        self.valid_moves = np.concatenate([self.valid_moves, np.zeros(edges, dtype=np.bool_)])
+        self.children = np.concatenate([self.children, np.full(edges, -1, dtype=np.int32)])
+        self.edge_capacity = capacity
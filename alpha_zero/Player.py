@@ -8,3 +8,10 @@ class Player():
 
     def play(self, board_state: np.array):
         pass
+
+    def reset(self):
+        '''
+        Called by Arena before every game. Players that keep state between
+        moves, e.g. a search tree, should start over here.
+        '''
+        pass
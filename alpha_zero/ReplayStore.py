@@ -0,0 +1,163 @@
+import os
+import re
+from typing import Callable, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from alpha_zero.Board import Board
+
+
+class ReplayStore():
+    """
+    The training examples of the latest max_shards self-play iterations, kept
+    on disk as numpy arrays instead of in a pickled list of tuples.
+
+    Each iteration is written once, as a shard of .npy files in folder:
+
+        examples_<number>.boards.npy  the boards, in the dtype of the game's boards
+        examples_<number>.pis.npy     the policy targets, float32
+        examples_<number>.vs.npy      the values, float32
+        examples_<number>.counts.npy  optional, the number of examples merged into each row, see merge_duplicates
+
+    and opened again memory-mapped, so adding an iteration writes only that
+    iteration, and the older shards are read from disk when they are used
+    rather than being held in memory. Shards that fall out of the history
+    are kept on disk, like the checkpoints.
+
+    Which shards make up the history of a model is recorded in a manifest
+    next to the model file (see save_manifest), so a training run resumed
+    from that model loads its own history, and not whatever shards are
+    newest in the folder.
+    """
+
+    PARTS = ('boards', 'pis', 'vs')
+    SHARD = re.compile(r'examples_(\d+)\.vs\.npy$')
+
+    def __init__(self, folder: str, max_shards: int):
+        """
+        :param folder: the folder new shards are written to
+        :param max_shards: number of iterations to keep, the oldest is dropped first
+        """
+        self.folder = folder
+        self.max_shards = max_shards
+        self.shards: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        '''(boards, pis, vs) of each iteration, oldest first'''
+
+        self.counts: List[Optional[np.ndarray]] = []
+        '''the counts of the rows of each shard, None for shards without duplicates merged'''
+
+        self.prefixes: List[str] = []
+        '''the path of each shard, without the part and .npy'''
+
+    def __len__(self) -> int:
+        return sum(len(vs) for _, _, vs in self.shards)
+
+    def add(self, examples: List[Tuple[Board, np.ndarray, float]], counts: Optional[List[int]] = None,
+            folder: Optional[str] = None):
+        '''
+        Write the examples of an iteration as a new shard and add it to the history.
+        An iteration without examples is skipped.
+
+        :param examples: the examples (board, pi, v) of the iteration
+        :param counts: the number of examples merged into each of examples, see merge_duplicates
+        :param folder: the folder to write the shard to, self.folder if not given
+        '''
+        if not examples:
+            return
+        folder = folder if folder is not None else self.folder
+        boards, pis, vs = zip(*examples)
+        arrays = {'boards': np.asarray(boards),
+                  'pis': np.asarray(pis, dtype=np.float32),
+                  'vs': np.asarray(vs, dtype=np.float32)}
+
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        numbers = self._shard_numbers(folder)
+        prefix = os.path.join(folder, 'examples_{:05d}'.format(numbers[-1] + 1 if numbers else 0))
+
+        parts = self.PARTS
+        if counts is not None:
+            arrays['counts'] = np.asarray(counts, dtype=np.int32)
+            parts = ('counts',) + parts
+
+        # the values are written last, a shard without them is incomplete and gets overwritten
+        for part in parts:
+            temporary = prefix + '.' + part + '.tmp'
+            with open(temporary, 'wb') as f:
+                np.save(f, arrays[part])
+            os.replace(temporary, prefix + '.' + part + '.npy')
+
+        self._append(prefix)
+
+    def save_manifest(self, manifest: str):
+        '''
+        Write the shards of the history to a manifest, one per line, oldest
+        first, relative to the folder of the manifest
+
+        :param manifest: the manifest file, e.g. the model file + ".shards"
+        '''
+        folder = os.path.dirname(manifest)
+        temporary = manifest + '.tmp'
+        with open(temporary, 'w') as f:
+            for prefix in self.prefixes:
+                f.write(os.path.relpath(prefix, folder) + '\n')
+        os.replace(temporary, manifest)
+
+    def load(self, manifest: str) -> int:
+        '''
+        Add the shards listed in a manifest to the history
+
+        :param manifest: a manifest written by save_manifest
+        :return: the number of shards added, 0 if there is no manifest
+        '''
+        if not os.path.isfile(manifest):
+            return 0
+        with open(manifest) as f:
+            prefixes = [line.strip() for line in f if line.strip()][-self.max_shards:]
+        for prefix in prefixes:
+            self._append(os.path.normpath(os.path.join(os.path.dirname(manifest), prefix)))
+        return len(prefixes)
+
+    def _append(self, prefix: str):
+        shard = tuple(np.load(prefix + '.' + part + '.npy', mmap_mode='r') for part in self.PARTS)
+        counts = np.load(prefix + '.counts.npy') if os.path.exists(prefix + '.counts.npy') else None
+        self.shards.append(shard)
+        self.counts.append(counts)
+        self.prefixes.append(prefix)
+        if len(self.shards) > self.max_shards:
+            print("len(trainExamplesHistory) =", len(self.shards), " => remove the oldest trainExamples")
+            self.shards.pop(0)
+            self.counts.pop(0)
+            self.prefixes.pop(0)
+
+    @classmethod
+    def _shard_numbers(cls, folder: str) -> List[int]:
+        if not os.path.isdir(folder):
+            return []
+        return sorted(int(match.group(1)) for match in map(cls.SHARD.match, os.listdir(folder)) if match)
+
+
+def merge_duplicates(examples: List[Tuple[Board, np.ndarray, float]], key: Callable[[Board], Hashable]) \
+        -> Tuple[List[Tuple[Board, np.ndarray, float]], List[int]]:
+    '''
+    Merge the examples of the same board into one, with the average of their
+    policies and values, e.g. the opening positions that every episode plays.
+
+    :param examples: examples (board, pi, v)
+    :param key: the key of a board, e.g. game.getStateKey
+    :return: (merged, counts): the merged examples in the order their boards first
+             occur, and the number of examples merged into each
+    '''
+    rows = {}
+    merged = []
+    counts = []
+    for board, pi, v in examples:
+        row = rows.setdefault(key(board), len(merged))
+        if row == len(merged):
+            merged.append([board, np.array(pi, dtype=np.float64), float(v)])
+            counts.append(1)
+        else:
+            merged[row][1] += pi
+            merged[row][2] += v
+            counts[row] += 1
+    return [(board, pi / count, v / count) for (board, pi, v), count in zip(merged, counts)], counts
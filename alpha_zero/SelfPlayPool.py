@@ -0,0 +1,134 @@
+import multiprocessing
+from typing import Iterator, List, Optional, Tuple, Type
+
+import numpy as np
+
+from alpha_zero.Game import Game
+from alpha_zero.InferenceServer import InferenceServer
+from alpha_zero.MCTS import MCTS
+from alpha_zero.NeuralNet import NeuralNet
+
+_coach = None
+'''the Coach of a worker process, set up by _init_worker'''
+
+_checkpoint = None
+'''the checkpoint the network of a worker process was last loaded from'''
+
+
+_remote = False
+'''True if the network of a worker process is an InferenceServer client'''
+
+
+def _init_worker(game: Game, nnet_class: Type[NeuralNet], args, nnet: Optional[NeuralNet]):
+    global _coach, _remote
+    from alpha_zero.Coach import Coach
+    _remote = nnet is not None
+    _coach = Coach(game, nnet if _remote else nnet_class(game), args)
+
+
+def _play_episode(task: Tuple[Tuple[str, str, int], int]) -> List[Tuple]:
+    global _checkpoint
+    checkpoint, seed = task
+
+    # the network is loaded once per checkpoint, not once per episode
+    if not _remote and checkpoint != _checkpoint:
+        folder, filename, _ = checkpoint
+        _coach.nnet.load_checkpoint(folder=folder, filename=filename)
+        _checkpoint = checkpoint
+
+    np.random.seed(seed)
+    _coach.mcts = MCTS(_coach.game, _coach.nnet, _coach.args)  # reset search tree
+    return _coach.executeEpisode()
+
+
+class SelfPlayPool():
+    """
+    A pool of processes that play self-play episodes for Coach.
+
+    Every worker builds its own game, network and Coach once, and loads the
+    network from a checkpoint file the first time it plays an episode with
+    it. The episodes are handed out one at a time, and their examples are
+    returned as soon as each episode ends, so the caller can report progress
+    across all the workers.
+
+    Each episode is seeded from (seed, iteration, episode), so an iteration
+    plays the same games whichever worker runs which episode.
+
+    With an InferenceServer, the workers have no network of their own: they
+    send the boards of their searches to the server, which evaluates them in
+    batches with the network of the calling process. The checkpoint is not
+    loaded then, the server always uses the current network.
+
+    The workers are started with the 'spawn' method, as the deep learning
+    frameworks do not survive a fork. The game, the network class and args
+    must therefore be picklable, and the network class importable.
+    """
+
+    def __init__(self, game: Game, nnet_class: Type[NeuralNet], args, workers: int,
+                 server: Optional[NeuralNet] = None):
+        """
+        :param game: the game to play
+        :param nnet_class: the NeuralNet class, a worker creates its network as nnet_class(game)
+        :param args: the Coach args
+        :param workers: number of processes
+        :param server: if given, the network the workers share through an InferenceServer
+        """
+        self.workers = workers
+        context = multiprocessing.get_context('spawn')
+
+        self.server = None
+        client = None
+        if server is not None:
+            self.server = InferenceServer(game, server, workers, context,
+                                          max_batch_size=args.get('inferenceBatchSize', 64),
+                                          max_wait=args.get('inferenceMaxWait', 0.001))
+            self.server.start()
+            client = self.server.client()
+
+        self.pool = context.Pool(workers, initializer=_init_worker, initargs=(game, nnet_class, args, client))
+
+    def play(self, folder: str, filename: str, iteration: int, number_episodes: int, seed: int = 0) \
+            -> Iterator[List[Tuple]]:
+        '''
+        Play episodes with the network saved in folder/filename
+
+        :param folder: folder of the checkpoint
+        :param filename: file name of the checkpoint
+        :param iteration: the training iteration, the workers reload the checkpoint when it changes
+        :param number_episodes: number of episodes to play
+        :param seed: base seed of the episodes
+        :return: iterator over the examples of each episode, in the order the episodes end
+        '''
+        checkpoint = (folder, filename, iteration)
+        tasks = [(checkpoint, self._seed(seed, iteration, episode)) for episode in range(number_episodes)]
+        return self.pool.imap_unordered(_play_episode, tasks)
+
+    def check(self):
+        '''
+        Raise the exception that made the InferenceServer fail, if it did. The
+        workers then fail with a RuntimeError that does not tell why.
+        '''
+        if self.server is not None:
+            self.server.check()
+
+    def close(self):
+        '''
+        Stop the workers, after the episodes that were asked for
+        '''
+        self.pool.close()
+        self.pool.join()
+        if self.server is not None:
+            self.server.close()
+
+    def terminate(self):
+        '''
+        Stop the workers now, dropping the episodes that have not ended
+        '''
+        self.pool.terminate()
+        self.pool.join()
+        if self.server is not None:
+            self.server.close()
+
+    @staticmethod
+    def _seed(seed: int, iteration: int, episode: int) -> int:
+        return int(np.random.RandomState([seed, iteration, episode]).randint(2 ** 31))
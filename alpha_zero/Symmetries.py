@@ -0,0 +1,83 @@
+from typing import List, Tuple
+
+import numpy as np
+
+
+class DihedralSymmetries():
+    """
+    The 8 rotations and reflections of a square board, as index permutations.
+
+    The symmetries are numbered in the order the games' getSymmetries list
+    them: rotate by 90 degrees i times for i in 1..4, each time with and
+    without a left-right flip.
+
+    The actions are assumed to be laid out as a square grid of cells, each
+    cell having actions_per_cell consecutive actions, followed by
+    extra_actions actions that do not move with the board (e.g. pass).
+    """
+
+    def __init__(self, board_n: int, cells_n: int = None, actions_per_cell: int = 1, extra_actions: int = 1):
+        """
+        :param board_n: the board is board_n x board_n
+        :param cells_n: the cells of the action grid are cells_n x cells_n, defaults to board_n
+        :param actions_per_cell: number of actions per cell of the action grid
+        :param extra_actions: number of actions after the grid that map to themselves
+        """
+        if cells_n is None:
+            cells_n = board_n
+
+        self.board_permutations = np.array([
+            index.ravel() for index in self._transforms(np.arange(board_n * board_n).reshape(board_n, board_n))])
+        '''board_permutations[k]: symmetric_board.ravel() == board.ravel()[board_permutations[k]]'''
+
+        cell_permutations = self._transforms(np.arange(cells_n * cells_n).reshape(cells_n, cells_n))
+        self.cell_permutations = np.array([cells.ravel() for cells in cell_permutations])
+        '''cell_permutations[k]: the cell of the action grid that cell c of the symmetric grid comes from'''
+
+        grid_size = cells_n * cells_n * actions_per_cell
+        extra = np.arange(grid_size, grid_size + extra_actions)
+        self.policy_permutations = np.array([
+            np.concatenate([(cells.ravel()[:, np.newaxis] * actions_per_cell + np.arange(actions_per_cell)).ravel(),
+                            extra])
+            for cells in cell_permutations])
+        '''policy_permutations[k]: the policy of the symmetric board is pi[policy_permutations[k]]'''
+
+        self.inverse_policy_permutations = np.argsort(self.policy_permutations, axis=1)
+        '''inverse_policy_permutations[k]: pi == symmetric_pi[inverse_policy_permutations[k]]'''
+
+    def __len__(self) -> int:
+        return len(self.board_permutations)
+
+    def apply(self, board: np.ndarray, pi: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        :param board: the board
+        :param pi: a policy vector for the board
+        :param k: the number of the symmetry
+        :return: the symmetric board and its policy vector
+        '''
+        return board.ravel()[self.board_permutations[k]].reshape(board.shape), np.asarray(pi)[self.policy_permutations[k]]
+
+    def canonical(self, board: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Pick one representative for all the boards that are symmetries of each
+        other: the one with the smallest bytes.
+
+        :param board: the board
+        :return: the representative, and the permutation that maps a policy for
+                 the representative back to board: pi = representative_pi[permutation]
+        '''
+        symmetric_boards = board.ravel()[self.board_permutations]
+        keys = [symmetric_board.tobytes() for symmetric_board in symmetric_boards]
+        k = min(range(len(keys)), key=keys.__getitem__)
+        return symmetric_boards[k].reshape(board.shape), self.inverse_policy_permutations[k]
+
+    @staticmethod
+    def _transforms(grid: np.ndarray) -> List[np.ndarray]:
+        transforms = []
+        for i in range(1, 5):
+            for j in [True, False]:
+                transformed = np.rot90(grid, i)
+                if j:
+                    transformed = np.fliplr(transformed)
+                transforms.append(transformed)
+        return transforms
@@ -0,0 +1,48 @@
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+import numpy as np
+
+
+class ValidMovesMemo():
+    """
+    Remembers the valid moves masks of the last max_size states, so a game
+    does not generate the moves of a board again when it is asked about it
+    repeatedly, e.g. by Arena, Coach and the players in turn.
+
+    The masks are read-only numpy arrays, so the same array can be handed out
+    to every caller.
+    """
+
+    def __init__(self, max_size: int):
+        """
+        :param max_size: number of states to remember, the least recently used is forgotten first
+        """
+        self.max_size = max_size
+        self.masks = OrderedDict()
+        '''maps the state key to its valid moves mask, least recently used first'''
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.masks)
+
+    def get(self, key: Hashable, valid_moves: Callable[[], np.ndarray]) -> np.ndarray:
+        '''
+        :param key: the key of the state, e.g. (board.tobytes(), player)
+        :param valid_moves: computes the mask when the state is not remembered
+        :return: the valid moves mask of the state
+        '''
+        mask = self.masks.get(key)
+        if mask is not None:
+            self.hits += 1
+            self.masks.move_to_end(key)
+            return mask
+
+        self.misses += 1
+        mask = valid_moves()
+        self.masks[key] = mask
+        if len(self.masks) > self.max_size:
+            self.masks.popitem(last=False)
+        return mask
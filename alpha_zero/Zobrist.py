@@ -0,0 +1,93 @@
+from typing import Iterable
+
+import numpy as np
+
+
+class ZobristHash():
+    """
+    Zobrist hashing of boards: every (cell, value) pair gets a random 64-bit
+    number, and the hash of a board is the XOR of the numbers of its cells.
+    Changing a cell from old to new only needs two XORs, so a game can keep
+    the hash up to date as it plays moves instead of rehashing the board.
+    Empty cells (value 0) contribute nothing.
+
+    For games whose canonical form negates the board (the two players are 1
+    and -1), set negatable. The key then holds two 64-bit hashes, of the board
+    and of its negation, so negate(key) is the key of -board without looking
+    at the board.
+    """
+
+    MASK = (1 << 64) - 1
+
+    def __init__(self, cells: int, values: Iterable[int], negatable: bool = False, seed: int = 0):
+        """
+        :param cells: number of cells of the board
+        :param values: all the values a cell can hold
+        :param negatable: keep the hash of the negated board in the key as well
+        :param seed: seed of the random numbers, the same seed gives the same keys in every process
+        """
+        values = np.asarray(sorted(set(values)))
+        if negatable:
+            values = np.union1d(values, -values)
+        self.offset = -int(values.min())
+        self.negatable = negatable
+
+        rng = np.random.RandomState(seed)
+        table = rng.randint(0, 2 ** 64, size=(cells, int(values.max()) + self.offset + 1), dtype=np.uint64)
+        table[:, self.offset] = 0
+
+        self._table = table
+        self._rows = np.arange(cells)
+        self._numbers = table.tolist()
+
+    def hash(self, board: np.ndarray) -> int:
+        '''
+        :param board: the board
+        :return: the 64-bit Zobrist hash of board
+        '''
+        columns = np.asarray(board).ravel().astype(np.intp) + self.offset
+        return int(np.bitwise_xor.reduce(self._table[self._rows, columns]))
+
+    def key(self, board: np.ndarray) -> int:
+        '''
+        :param board: the board
+        :return: the key of board, computed from scratch
+        '''
+        if self.negatable:
+            return (self.hash(board) << 64) | self.hash(-np.asarray(board))
+        return self.hash(board)
+
+    def update(self, key: int, cell: int, old: int, new: int) -> int:
+        '''
+        :param key: the key of the board
+        :param cell: the index of a cell in the flattened board
+        :param old: the value of the cell on the board
+        :param new: the new value of the cell
+        :return: the key of the board with the cell changed
+        '''
+        numbers = self._numbers[cell]
+        offset = self.offset
+        change = numbers[old + offset] ^ numbers[new + offset]
+        if self.negatable:
+            change = (change << 64) | (numbers[offset - old] ^ numbers[offset - new])
+        return key ^ change
+
+    def update_board(self, key: int, board: np.ndarray, next_board: np.ndarray) -> int:
+        '''
+        :param key: the key of board
+        :param board: the board
+        :param next_board: a board of the same shape
+        :return: the key of next_board, updated for the cells that differ
+        '''
+        board = np.asarray(board).ravel()
+        next_board = np.asarray(next_board).ravel()
+        for cell in np.flatnonzero(board != next_board).tolist():
+            key = self.update(key, cell, int(board[cell]), int(next_board[cell]))
+        return key
+
+    def negate(self, key: int) -> int:
+        '''
+        :param key: the key of a board, from a negatable hash
+        :return: the key of the negated board
+        '''
+        return ((key & self.MASK) << 64) | (key >> 64)
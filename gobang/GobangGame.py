@@ -1,8 +1,9 @@
 from __future__ import print_function
-import sys
-sys.path.append('..')
-from Game import Game
-from .GobangLogic import Board
+from alpha_zero.Game import Game
+from alpha_zero.InARow import InARow
+from alpha_zero.Symmetries import DihedralSymmetries
+from alpha_zero.Zobrist import ZobristHash
+from .GobangLogic import GobangBoard as Board
 import numpy as np
 
 
@@ -10,6 +11,9 @@ class GobangGame(Game):
     def __init__(self, n=15, nir=5):
         self.n = n
         self.n_in_row = nir
+        self.in_a_row = InARow(n, nir)
+        self.symmetries = DihedralSymmetries(n)
+        self.zobrist = ZobristHash(n*n, (-1, 0, 1), negatable=True)
 
     def getInitBoard(self):
         # return initial board (numpy board)
@@ -37,41 +41,31 @@ class GobangGame(Game):
 
     # modified
     def getValidMoves(self, board, player):
-        # return a fixed size binary vector
-        valids = [0] * self.getActionSize()
-        b = Board(self.n)
-        b.pieces = np.copy(board)
-        legalMoves = b.get_legal_moves(player)
-        if len(legalMoves) == 0:
-            valids[-1] = 1
-            return np.array(valids)
-        for x, y in legalMoves:
-            valids[self.n * x + y] = 1
-        return np.array(valids)
+        # return a fixed size, read-only boolean vector: the empty squares, or pass when there are none
+        valids = np.zeros(self.getActionSize(), dtype=np.bool_)
+        np.equal(board.ravel(), 0, out=valids[:-1])
+        valids[-1] = not valids[:-1].any()
+        valids.flags.writeable = False
+        return valids
 
     # modified
     def getGameEnded(self, board, player):
-        # return 0 if not ended, 1 if player 1 won, -1 if player 1 lost
-        # player = 1
-        b = Board(self.n)
-        b.pieces = np.copy(board)
-        n = self.n_in_row
-
-        for w in range(self.n):
-            for h in range(self.n):
-                if (w in range(self.n - n + 1) and board[w][h] != 0 and
-                        len(set(board[i][h] for i in range(w, w + n))) == 1):
-                    return board[w][h]
-                if (h in range(self.n - n + 1) and board[w][h] != 0 and
-                        len(set(board[w][j] for j in range(h, h + n))) == 1):
-                    return board[w][h]
-                if (w in range(self.n - n + 1) and h in range(self.n - n + 1) and board[w][h] != 0 and
-                        len(set(board[w + k][h + k] for k in range(n))) == 1):
-                    return board[w][h]
-                if (w in range(self.n - n + 1) and h in range(self.n - n + 1, self.n) and board[w][h] != 0 and
-                        len(set(board[w + l][h - l] for l in range(n))) == 1):
-                    return board[w][h]
-        if b.has_legal_moves():
+        # return 0 if not ended, 1 if player won, -1 if player lost
+        winner = self.in_a_row.winner(board)
+        if winner != 0:
+            return player * winner
+        if (board == 0).any():
+            return 0
+        return 1e-4
+
+    def getGameEndedAfterMove(self, board, player, action):
+        # only the lines through the stone just placed can have been completed
+        if action == self.n * self.n:
+            return self.getGameEnded(board, player)
+        x, y = divmod(action, self.n)
+        if self.in_a_row.wins_through(board, x, y):
+            return player * board[x][y]
+        if (board == 0).any():
             return 0
         return 1e-4
 
@@ -82,23 +76,30 @@ class GobangGame(Game):
     # modified
     def getSymmetries(self, board, pi):
         # mirror, rotational
-        assert(len(pi) == self.n**2 + 1)  # 1 for pass
-        pi_board = np.reshape(pi[:-1], (self.n, self.n))
-        l = []
-
-        for i in range(1, 5):
-            for j in [True, False]:
-                newB = np.rot90(board, i)
-                newPi = np.rot90(pi_board, i)
-                if j:
-                    newB = np.fliplr(newB)
-                    newPi = np.fliplr(newPi)
-                l += [(newB, list(newPi.ravel()) + [pi[-1]])]
-        return l
+        assert(len(pi) == self.n**2+1)  # 1 for pass
+        return [self.symmetries.apply(board, pi, k) for k in range(len(self.symmetries))]
+
+    def getSymmetryPermutations(self):
+        return self.symmetries.board_permutations, self.symmetries.policy_permutations
+
+    def getCanonicalSymmetry(self, board):
+        # representative of the mirror, rotational symmetries
+        return self.symmetries.canonical(board)
 
     def stringRepresentation(self, board):
         # 8x8 numpy array (canonical board)
-        return board.tostring()
+        return board.tobytes()
+
+    def getStateKey(self, board):
+        # Zobrist key of the canonical board
+        return self.zobrist.key(board)
+
+    def getNextCanonicalState(self, board, action, key):
+        # the new stone is the only changed cell, the opponent's view negates the key
+        next_board, next_player = self.getNextState(board, 1, action)
+        if action != self.n*self.n:
+            key = self.zobrist.update(key, action, 0, 1)
+        return self.getCanonicalForm(next_board, next_player), self.zobrist.negate(key)
 
 
 def display(board):
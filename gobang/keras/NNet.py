@@ -10,6 +10,7 @@ import tensorflow as tf
 sys.path.append('..')
 from utils import *
 from NeuralNet import NeuralNet
+from alpha_zero.ExampleSampler import ExampleSampler
 
 import argparse
 from .GobangNNet import GobangNNet as onnet
@@ -34,13 +35,13 @@ class NNetWrapper(NeuralNet):
 
     def train(self, examples):
         """
-        examples: list of examples, each example is of form (board, pi, v)
+        examples: an ExampleSampler or a list of examples, each example is of form (board, pi, v)
         """
-        input_boards, target_pis, target_vs = list(zip(*examples))
-        input_boards = np.asarray(input_boards)
-        target_pis = np.asarray(target_pis)
-        target_vs = np.asarray(target_vs)
-        self.nnet.model.fit(x = input_boards, y = [target_pis, target_vs], batch_size = args.batch_size, epochs = args.epochs)
+        examples = ExampleSampler.of(examples)
+        batches = ((boards, [pis, vs]) for boards, pis, vs in examples.generate(args.batch_size))
+        self.nnet.model.fit_generator(batches,
+                                      steps_per_epoch = examples.steps(args.batch_size),
+                                      epochs = args.epochs)
 
     def predict(self, board):
         """
@@ -59,6 +60,17 @@ class NNetWrapper(NeuralNet):
         #print('PREDICTION TIME TAKEN : {0:03f}'.format(time.time()-start))
         return pi[0], v[0]
 
+    def predict_batch(self, boards):
+        """
+        boards: np array with a batch of boards
+        """
+        with self.graph.as_default():
+            # run, as one batch
+            self.nnet.model._make_predict_function()
+            pis, vs = self.nnet.model.predict(boards, batch_size=len(boards))
+
+        return pis, vs[:, 0]
+
     def save_checkpoint(self, folder='checkpoint', filename='checkpoint.pth.tar'):
         filepath = os.path.join(folder, filename)
         if not os.path.exists(folder):
@@ -1,7 +1,6 @@
 import os
 import shutil
 import time
-import random
 import numpy as np
 import math
 import sys
@@ -9,6 +8,7 @@ sys.path.append('../../')
 from utils import *
 from pytorch_classification.utils import Bar, AverageMeter
 from NeuralNet import NeuralNet
+from alpha_zero.ExampleSampler import ExampleSampler
 
 import tensorflow as tf
 from .GobangNNet import GobangNNet as onnet
@@ -35,8 +35,9 @@ class NNetWrapper(NeuralNet):
 
     def train(self, examples):
         """
-        examples: list of examples, each example is of form (board, pi, v)
+        examples: an ExampleSampler or a list of examples, each example is of form (board, pi, v)
         """
+        examples = ExampleSampler.of(examples)
 
         for epoch in range(args.epochs):
             print('EPOCH ::: ' + str(epoch+1))
@@ -51,8 +52,7 @@ class NNetWrapper(NeuralNet):
 
             # self.sess.run(tf.local_variables_initializer())
             while batch_idx < int(len(examples)/args.batch_size):
-                sample_ids = np.random.randint(len(examples), size=args.batch_size)
-                boards, pis, vs = list(zip(*[examples[i] for i in sample_ids]))
+                boards, pis, vs = examples.sample(args.batch_size)
 
                 # predict and compute gradient and do SGD step
                 input_dict = {self.nnet.input_boards: boards, self.nnet.target_pis: pis, self.nnet.target_vs: vs, self.nnet.dropout: args.dropout, self.nnet.isTraining: True}
@@ -102,6 +102,15 @@ class NNetWrapper(NeuralNet):
         #print('PREDICTION TIME TAKEN : {0:03f}'.format(time.time()-start))
         return prob[0], v[0]
 
+    def predict_batch(self, boards):
+        """
+        boards: np array with a batch of boards
+        """
+        # run
+        probs, vs = self.sess.run([self.nnet.prob, self.nnet.v], feed_dict={self.nnet.input_boards: boards, self.nnet.dropout: 0, self.nnet.isTraining: False})
+
+        return probs, vs[:, 0]
+
     def save_checkpoint(self, folder='checkpoint', filename='checkpoint.pth.tar'):
         filepath = os.path.join(folder, filename)
         if not os.path.exists(folder):
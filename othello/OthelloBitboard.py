@@ -0,0 +1,129 @@
+'''
+Bitboard move generation for Othello boards of up to 8x8 squares.
+
+The squares of one color are the bits of a Python int: square (x,y) is bit
+x*n+y, the same number as the action that plays there. Moves and flips are
+found for all squares at once by shifting the bitboards one step in each of
+the 8 directions and masking with the opponent's pieces, instead of walking
+the board square by square.
+
+The boards are converted from and to the numpy arrays of OthelloGame
+(1=white, -1=black, 0=empty) by shifting and masking with the bit of each
+square in a uint64.
+'''
+from typing import Tuple
+
+import numpy as np
+
+
+class OthelloBitboard():
+
+    MAX_N = 8
+    '''the largest board that fits in 64 bits'''
+
+    def __init__(self, n: int):
+        """
+        :param n: the board is n x n, at most MAX_N
+        """
+        assert 0 < n <= self.MAX_N
+
+        self.n = n
+        self.full = (1 << (n * n)) - 1
+
+        not_first = sum(1 << (x * n + y) for x in range(n) for y in range(1, n))
+        not_last = sum(1 << (x * n + y) for x in range(n) for y in range(n - 1))
+
+        # (shift, mask) for each of the 8 directions (dx,dy): shifting the bits
+        # of mask by shift = dx*n+dy moves them one square, the squares that
+        # would wrap around into the next row are masked out first
+        self.directions = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if dx == 0 and dy == 0:
+                    continue
+                mask = {-1: not_first, 0: self.full, 1: not_last}[dy]
+                self.directions.append((dx * n + dy, mask))
+
+        self.squares = np.arange(n * n, dtype=np.uint64)
+        '''the bit number of each square'''
+
+    def from_array(self, board: np.ndarray, color: int) -> Tuple[int, int]:
+        '''
+        :param board: the numpy board
+        :param color: the color to move (1 for white, -1 for black)
+        :return: (own, opponent): the bitboards of the pieces of color and of -color
+        '''
+        board = np.asarray(board).ravel()
+        return self._pack(board == color), self._pack(board == -color)
+
+    def to_mask(self, bits: int) -> np.ndarray:
+        '''
+        :param bits: a bitboard
+        :return: boolean vector of length n*n, True for the squares that are set
+        '''
+        return (np.uint64(bits) >> self.squares) & np.uint64(1) != 0
+
+    def legal_moves(self, own: int, opponent: int) -> int:
+        '''
+        :param own: bitboard of the pieces of the color to move
+        :param opponent: bitboard of the opponent's pieces
+        :return: bitboard of the empty squares that flip at least one piece
+        '''
+        empty = ~(own | opponent) & self.full
+        moves = 0
+        for shift, mask in self.directions:
+            # the opponent's pieces in a run that starts next to an own piece,
+            # a run is at most n-2 long
+            run = self._shift(own, shift, mask) & opponent
+            for _ in range(self.n - 3):
+                run |= self._shift(run, shift, mask) & opponent
+            moves |= self._shift(run, shift, mask) & empty
+        return moves
+
+    def flips(self, own: int, opponent: int, square: int) -> int:
+        '''
+        :param own: bitboard of the pieces of the color to move
+        :param opponent: bitboard of the opponent's pieces
+        :param square: the square played, x*n+y
+        :return: bitboard of the opponent's pieces flipped by playing square
+        '''
+        flips = 0
+        move = 1 << square
+        for shift, mask in self.directions:
+            run = 0
+            step = self._shift(move, shift, mask)
+            while step & opponent:
+                run |= step
+                step = self._shift(step, shift, mask)
+            if step & own:
+                flips |= run
+        return flips
+
+    def status(self, own: int, opponent: int) -> Tuple[int, int, int]:
+        '''
+        Everything getGameEnded and getValidMoves need to know about a board
+
+        :param own: bitboard of the pieces of one color
+        :param opponent: bitboard of the pieces of the other color
+        :return: (own_moves, opponent_moves, difference): the legal moves of
+                 both colors and the number of own minus opponent pieces
+        '''
+        return (self.legal_moves(own, opponent),
+                self.legal_moves(opponent, own),
+                self.count(own) - self.count(opponent))
+
+    @staticmethod
+    def count(bits: int) -> int:
+        '''
+        :param bits: a bitboard
+        :return: the number of squares that are set
+        '''
+        return bin(bits).count('1')
+
+    def _shift(self, bits: int, shift: int, mask: int) -> int:
+        if shift > 0:
+            return ((bits & mask) << shift) & self.full
+        return (bits & mask) >> -shift
+
+    def _pack(self, squares: np.ndarray) -> int:
+        return int(np.sum(np.uint64(1) << self.squares[squares], dtype=np.uint64))
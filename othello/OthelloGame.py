@@ -1,14 +1,27 @@
 from __future__ import print_function
-import sys
-sys.path.append('..')
-from Game import Game
-from .OthelloLogic import Board
+from alpha_zero.Game import Game
+from alpha_zero.Symmetries import DihedralSymmetries
+from alpha_zero.ValidMovesMemo import ValidMovesMemo
+from alpha_zero.Zobrist import ZobristHash
+from .OthelloBitboard import OthelloBitboard
+from .OthelloLogic import OthelloBoard as Board
 import numpy as np
 
 
 class OthelloGame(Game):
-    def __init__(self, n):
+    def __init__(self, n, valid_moves_memo=0):
+        """
+        :param n: the board is n x n
+        :param valid_moves_memo: number of states to remember the valid moves of, 0 for none
+        """
         self.n = n
+        self.valid_moves_memo = ValidMovesMemo(valid_moves_memo) if valid_moves_memo else None
+        self.symmetries = DihedralSymmetries(n)
+        self.zobrist = ZobristHash(n*n, (-1, 0, 1), negatable=True)
+        # boards that fit in 64 bits use the bitboard move generation, larger ones OthelloBoard
+        self.bitboard = OthelloBitboard(n) if n <= OthelloBitboard.MAX_N else None
+        self._last_status = None
+        '''(board bytes, bitboard status) of the last board asked about'''
 
     def getInitBoard(self):
         # return initial board (numpy board)
@@ -28,6 +41,14 @@ class OthelloGame(Game):
         # action must be a valid move
         if action == self.n*self.n:
             return (board, -player)
+        if self.bitboard is not None:
+            action = int(action)  # players return numpy ints, the bitboards need Python ints
+            own, opponent = self.bitboard.from_array(board, player)
+            flips = self.bitboard.flips(own, opponent, action)
+            assert flips
+            next_board = np.array(board)
+            next_board.ravel()[self.bitboard.to_mask(flips | (1 << action))] = player
+            return (next_board, -player)
         b = Board(self.n)
         b.pieces = np.copy(board)
         move = (int(action/self.n), action%self.n)
@@ -35,23 +56,42 @@ class OthelloGame(Game):
         return (b.pieces, -player)
 
     def getValidMoves(self, board, player):
-        # return a fixed size binary vector
-        valids = [0]*self.getActionSize()
+        # return a fixed size, read-only boolean vector
+        if self.valid_moves_memo is not None:
+            return self.valid_moves_memo.get((board.tobytes(), player), lambda: self._valid_moves(board, player))
+        return self._valid_moves(board, player)
+
+    def _valid_moves(self, board, player):
+        valids = np.zeros(self.getActionSize(), dtype=np.bool_)
+        if self.bitboard is not None:
+            moves, _, _ = self._status(board, player)
+            valids[:-1] = self.bitboard.to_mask(moves)
+            valids[-1] = moves == 0
+            valids.flags.writeable = False
+            return valids
         b = Board(self.n)
-        b.pieces = np.copy(board)
-        legalMoves =  b.get_legal_moves(player)
+        b.pieces = board
+        legalMoves = b.get_legal_moves(player)
         if len(legalMoves)==0:
-            valids[-1]=1
-            return np.array(valids)
-        for x, y in legalMoves:
-            valids[self.n*x+y]=1
-        return np.array(valids)
+            valids[-1] = True
+        else:
+            moves = np.array(legalMoves)
+            valids[self.n*moves[:, 0] + moves[:, 1]] = True
+        valids.flags.writeable = False
+        return valids
 
     def getGameEnded(self, board, player):
         # return 0 if not ended, 1 if player 1 won, -1 if player 1 lost
         # player = 1
+        if self.bitboard is not None:
+            moves, opponent_moves, difference = self._status(board, player)
+            if moves or opponent_moves:
+                return 0
+            if difference > 0:
+                return 1
+            return -1
         b = Board(self.n)
-        b.pieces = np.copy(board)
+        b.pieces = board
         if b.has_legal_moves(player):
             return 0
         if b.has_legal_moves(-player):
@@ -60,6 +100,28 @@ class OthelloGame(Game):
             return 1
         return -1
 
+    def _status(self, board, player):
+        """
+        The legal moves of both players and the disc difference, found in one
+        pass over the bitboards. The result for the last board is kept, so
+        getGameEnded and getValidMoves for the same board, as MCTS asks them
+        for a new leaf, share the work.
+
+        :param board: the board
+        :param player: the player to move (1 or -1)
+        :return: (moves, opponent_moves, difference) seen from player
+        """
+        key = board.tobytes()
+        # read the cache once, another thread sharing the game may replace it meanwhile
+        last_status = self._last_status
+        if last_status is None or last_status[0] != key:
+            last_status = (key, self.bitboard.status(*self.bitboard.from_array(board, 1)))
+            self._last_status = last_status
+        moves, opponent_moves, difference = last_status[1]
+        if player == 1:
+            return moves, opponent_moves, difference
+        return opponent_moves, moves, -difference
+
     def getCanonicalForm(self, board, player):
         # return state if player==1, else return -state if player==-1
         return player*board
@@ -67,22 +129,28 @@ class OthelloGame(Game):
     def getSymmetries(self, board, pi):
         # mirror, rotational
         assert(len(pi) == self.n**2+1)  # 1 for pass
-        pi_board = np.reshape(pi[:-1], (self.n, self.n))
-        l = []
-
-        for i in range(1, 5):
-            for j in [True, False]:
-                newB = np.rot90(board, i)
-                newPi = np.rot90(pi_board, i)
-                if j:
-                    newB = np.fliplr(newB)
-                    newPi = np.fliplr(newPi)
-                l += [(newB, list(newPi.ravel()) + [pi[-1]])]
-        return l
+        return [self.symmetries.apply(board, pi, k) for k in range(len(self.symmetries))]
+
+    def getSymmetryPermutations(self):
+        return self.symmetries.board_permutations, self.symmetries.policy_permutations
+
+    def getCanonicalSymmetry(self, board):
+        # representative of the mirror, rotational symmetries
+        return self.symmetries.canonical(board)
 
     def stringRepresentation(self, board):
         # 8x8 numpy array (canonical board)
-        return board.tostring()
+        return board.tobytes()
+
+    def getStateKey(self, board):
+        # Zobrist key of the canonical board
+        return self.zobrist.key(board)
+
+    def getNextCanonicalState(self, board, action, key):
+        # update the key for the new stone and the flipped ones, the opponent's view negates it
+        next_board, next_player = self.getNextState(board, 1, action)
+        key = self.zobrist.update_board(key, board, next_board)
+        return self.getCanonicalForm(next_board, next_player), self.zobrist.negate(key)
 
     def getScore(self, board, player):
         b = Board(self.n)
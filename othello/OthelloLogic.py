@@ -123,7 +123,7 @@ class OthelloBoard(Board):
         color = self[x][y]
         flips = []
 
-        for x, y in Board._increment_move(origin, direction, self.n):
+        for x, y in OthelloBoard._increment_move(origin, direction, self.n):
             if self[x][y] == 0:
                 if flips:
                     # print("Found", x,y)
@@ -142,7 +142,7 @@ class OthelloBoard(Board):
         #initialize variables
         flips = [origin]
 
-        for x, y in Board._increment_move(origin, direction, self.n):
+        for x, y in OthelloBoard._increment_move(origin, direction, self.n):
             #print(x,y)
             if self[x][y] == 0:
                 return []
@@ -4,10 +4,12 @@ import shutil
 import time
 import random
 import numpy as np
+import tensorflow as tf
 import math
 import sys
 
 from alpha_zero.NeuralNet import NeuralNet
+from alpha_zero.ExampleSampler import ExampleSampler
 from alpha_zero.utils import dotdict
 
 sys.path.append('..')
@@ -27,19 +29,21 @@ args = dotdict({
 
 class NNetWrapper(NeuralNet):
     def __init__(self, game):
+        # the graph the model is built in, predictions may come from other threads, e.g. an InferenceServer
+        self.graph = tf.get_default_graph()
         self.nnet = onnet(game, args)
         self.board_x, self.board_y = game.getBoardSize()
         self.action_size = game.getActionSize()
 
     def train(self, examples):
         """
-        examples: list of examples, each example is of form (board, pi, v)
+        examples: an ExampleSampler or a list of examples, each example is of form (board, pi, v)
         """
-        input_boards, target_pis, target_vs = list(zip(*examples))
-        input_boards = np.asarray(input_boards)
-        target_pis = np.asarray(target_pis)
-        target_vs = np.asarray(target_vs)
-        self.nnet.model.fit(x = input_boards, y = [target_pis, target_vs], batch_size = args.batch_size, epochs = args.epochs)
+        examples = ExampleSampler.of(examples)
+        batches = ((boards, [pis, vs]) for boards, pis, vs in examples.generate(args.batch_size))
+        self.nnet.model.fit_generator(batches,
+                                      steps_per_epoch = examples.steps(args.batch_size),
+                                      epochs = args.epochs)
 
     def predict(self, board):
         """
@@ -51,12 +55,25 @@ class NNetWrapper(NeuralNet):
         # preparing input
         board = board[np.newaxis, :, :]
 
-        # run
-        pi, v = self.nnet.model.predict(board)
+        with self.graph.as_default():
+            # run
+            self.nnet.model._make_predict_function()
+            pi, v = self.nnet.model.predict(board)
 
         #print('PREDICTION TIME TAKEN : {0:03f}'.format(time.time()-start))
         return pi[0], v[0]
 
+    def predict_batch(self, boards):
+        """
+        boards: np array with a batch of boards
+        """
+        with self.graph.as_default():
+            # run, as one batch
+            self.nnet.model._make_predict_function()
+            pis, vs = self.nnet.model.predict(boards, batch_size=len(boards))
+
+        return pis, vs[:, 0]
+
     def save_checkpoint(self, folder='checkpoint', filename='checkpoint.pth.tar'):
         filepath = os.path.join(folder, filename)
         if not os.path.exists(folder):
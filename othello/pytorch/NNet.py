@@ -2,7 +2,6 @@ import argparse
 import os
 import shutil
 import time
-import random
 import numpy as np
 import math
 import sys
@@ -10,6 +9,7 @@ sys.path.append('../../')
 from utils import *
 from pytorch_classification.utils import Bar, AverageMeter
 from NeuralNet import NeuralNet
+from alpha_zero.ExampleSampler import ExampleSampler
 
 import argparse
 import torch
@@ -41,8 +41,9 @@ class NNetWrapper(NeuralNet):
 
     def train(self, examples):
         """
-        examples: list of examples, each example is of form (board, pi, v)
+        examples: an ExampleSampler or a list of examples, each example is of form (board, pi, v)
         """
+        examples = ExampleSampler.of(examples)
         optimizer = optim.Adam(self.nnet.parameters())
 
         for epoch in range(args.epochs):
@@ -58,11 +59,7 @@ class NNetWrapper(NeuralNet):
             batch_idx = 0
 
             while batch_idx < int(len(examples)/args.batch_size):
-                sample_ids = np.random.randint(len(examples), size=args.batch_size)
-                boards, pis, vs = list(zip(*[examples[i] for i in sample_ids]))
-                boards = torch.FloatTensor(np.array(boards).astype(np.float64))
-                target_pis = torch.FloatTensor(np.array(pis))
-                target_vs = torch.FloatTensor(np.array(vs).astype(np.float64))
+                boards, target_pis, target_vs = map(torch.from_numpy, examples.sample(args.batch_size))
 
                 # predict
                 if args.cuda:
@@ -126,6 +123,21 @@ class NNetWrapper(NeuralNet):
         #print('PREDICTION TIME TAKEN : {0:03f}'.format(time.time()-start))
         return torch.exp(pi).data.cpu().numpy()[0], v.data.cpu().numpy()[0]
 
+    def predict_batch(self, boards):
+        """
+        boards: np array with a batch of boards
+        """
+        # preparing input
+        boards = torch.FloatTensor(np.asarray(boards).astype(np.float64))
+        if args.cuda: boards = boards.contiguous().cuda()
+        boards = Variable(boards, volatile=True)
+        boards = boards.view(-1, self.board_x, self.board_y)
+
+        self.nnet.eval()
+        pis, vs = self.nnet(boards)
+
+        return torch.exp(pis).data.cpu().numpy(), vs.data.cpu().numpy()[:, 0]
+
     def loss_pi(self, targets, outputs):
         return -torch.sum(targets*outputs)/targets.size()[0]
 
@@ -47,11 +47,31 @@ class Piece():
         # return f"Piece({self.p1},{self.p2},{self.p3},{self.p4})"
 
     def __int__(self) -> int:
-        return  (1<<4) + (self[3]<<3) + (self[2]<<2)+(self[1]<<1)+(self[0]<<0)
+        # the value on the board, the piece number with the 'taken' bit set
+        return (1<<4) + self.toInt()
 
     def __getitem__(self, item:int):
         return self.bools[item]
 
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Piece) and self.toInt() == other.toInt()
+
+    def __hash__(self) -> int:
+        return self.toInt()
+
+    def toInt(self) -> int:
+        # the piece number 0..15, the property bits in the order of the binary string
+        return (self[0]<<3) + (self[1]<<2) + (self[2]<<1) + (self[3]<<0)
+
+    @staticmethod
+    def fromInt(value: int) -> 'Piece':
+        return Piece(value)
+
+    @staticmethod
+    def fromNP(value: int) -> 'Piece':
+        # the piece as typed by a player, e.g. int('0110', 2)
+        return Piece(value)
+
     # def roll(self) -> 'Piece':
     #     return Piece(self.p2, self.p3, self.p4, self.p1)
 
@@ -106,7 +126,7 @@ class QuatroBoard(Board):
 
     @property
     def pieces(self) -> List[Piece]:
-        pieces = [Piece(x) for x in range(self.n * self.n)]
+        pieces = [Piece(x) for x in range(1 << (self.n - 1))]
         return pieces
 
     @property
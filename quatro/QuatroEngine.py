@@ -0,0 +1,214 @@
+'''
+Packed Quatro rules used by QuatroGame.
+
+The 16 squares of the playing field are numbered x*4+y, leaving out the
+middle row and column of QuatroGame's 5x5 board, and a piece is the number
+made of its 4 property bits (color, height, shape, surface), 0..15.
+
+A position is packed in four ints, see QuatroState. Four pieces in a line
+share a property when the AND of the line's nibbles, or the AND of their
+complements (the NOR), has a bit set, so a line is checked with a few shifts
+and ANDs instead of building Piece objects.
+
+QuatroGame's numpy board holds 0 on an empty square and 16+piece on a taken
+one, and the middle square holds the selected piece the same way (0 once
+all pieces have been placed).
+'''
+from functools import lru_cache
+from typing import List, NamedTuple, Tuple
+
+import numpy as np
+
+
+class QuatroState(NamedTuple):
+    pieces: int
+    '''4 bits per square, the piece on square s is (pieces >> 4*s) & 0xF'''
+
+    occupied: int
+    '''bit s is set if square s holds a piece'''
+
+    used: int
+    '''bit p is set if piece p is on the board or selected'''
+
+    selected: int
+    '''the piece the player to move has to place, QuatroEngine.NO_PIECE when there is none'''
+
+
+class ActionTables(NamedTuple):
+    squares: np.ndarray
+    '''squares[action]: the square the selected piece is placed on, -1 for actions that are never valid'''
+
+    pieces: np.ndarray
+    '''pieces[action]: the piece selected for the opponent, -1 for actions that are never valid'''
+
+    actions: np.ndarray
+    '''actions[square, piece]: the action number'''
+
+
+@lru_cache(maxsize=None)
+def action_tables(n: int) -> ActionTables:
+    '''
+    The action numbers of QuatroGame are x << (n+1) | y << (n-1) | piece, with
+    x,y the coordinates on the playing field. The tables between the action
+    numbers and (square, piece) are built once per board size and are read-only.
+
+    :param n: the numpy board is n x n, including the middle row and column
+    :return: the tables
+    '''
+    size = (1 << (n + 3)) + 1
+    squares = np.full(size, -1, dtype=np.intp)
+    pieces = np.full(size, -1, dtype=np.intp)
+    actions = np.zeros((QuatroEngine.SQUARES, QuatroEngine.PIECES), dtype=np.intp)
+    for x in range(4):
+        for y in range(4):
+            for piece in range(QuatroEngine.PIECES):
+                action = (x << (n + 1)) | (y << (n - 1)) | piece
+                squares[action] = x * 4 + y
+                pieces[action] = piece
+                actions[x * 4 + y, piece] = action
+
+    for table in (squares, pieces, actions):
+        table.flags.writeable = False
+    return ActionTables(squares=squares, pieces=pieces, actions=actions)
+
+
+class QuatroEngine():
+
+    SQUARES = 16
+    PIECES = 16
+    NO_PIECE = -1
+    TAKEN = 16
+    '''added to the piece number on the squares of the numpy board, so piece 0 is not empty'''
+
+    ALL = (1 << 16) - 1
+
+    BIT_NUMBERS = np.arange(16)
+    '''the bit numbers of a 16-bit mask, lowest first'''
+
+    def __init__(self, n: int = 5):
+        """
+        :param n: the numpy board is n x n, including the middle row and column
+        """
+        mid = n // 2
+        coordinates = [c for c in range(n) if c != mid]
+        assert len(coordinates) ** 2 == self.SQUARES
+
+        self.n = n
+        self.board_squares = np.array([x * n + y for x in coordinates for y in coordinates])
+        '''board_squares[s]: the index of square s in the flattened numpy board'''
+
+        self.center = mid * n + mid
+        '''the index of the selected piece in the flattened numpy board'''
+
+        rows = [[x * 4 + y for y in range(4)] for x in range(4)]
+        columns = [[x * 4 + y for x in range(4)] for y in range(4)]
+        diagonals = [[d * 4 + d for d in range(4)], [d * 4 + 3 - d for d in range(4)]]
+        self.lines: List[List[int]] = rows + columns + diagonals
+        '''the squares of the 4 rows, 4 columns and 2 diagonals'''
+
+        self.line_masks = [sum(1 << s for s in line) for line in self.lines]
+        '''the squares of each line as a bitmask, to test that it is full'''
+
+        self.square_lines = [[i for i, line in enumerate(self.lines) if s in line] for s in range(self.SQUARES)]
+        '''square_lines[s]: the lines through square s'''
+
+    def init_board(self) -> np.ndarray:
+        '''
+        :return: the numpy board of a new game, with piece 0 selected
+        '''
+        board = np.zeros((self.n, self.n), dtype=int)
+        board.ravel()[self.center] = self.TAKEN + 0
+        return board
+
+    def pack(self, board: np.ndarray) -> QuatroState:
+        '''
+        :param board: the numpy board
+        :return: the packed position
+        '''
+        board = np.asarray(board).ravel()
+        pieces = occupied = used = 0
+        for square, value in enumerate(board[self.board_squares].tolist()):
+            if value:
+                piece = int(value) & 0xF
+                pieces |= piece << 4 * square
+                occupied |= 1 << square
+                used |= 1 << piece
+
+        selected = int(board[self.center])
+        if selected:
+            selected &= 0xF
+            used |= 1 << selected
+        else:
+            selected = self.NO_PIECE
+
+        return QuatroState(pieces=pieces, occupied=occupied, used=used, selected=selected)
+
+    def legal(self, state: QuatroState) -> Tuple[int, int]:
+        '''
+        :param state: the position
+        :return: (squares, pieces): bitmasks of the empty squares and of the pieces
+                 that can be handed to the opponent. When no piece is left, the
+                 last move hands over the selected piece, as a placeholder.
+        '''
+        remaining = ~state.used & self.ALL
+        if not remaining and state.selected != self.NO_PIECE:
+            remaining = 1 << state.selected
+        return ~state.occupied & self.ALL, remaining
+
+    def play(self, board: np.ndarray, square: int, piece: int) -> np.ndarray:
+        '''
+        Place the selected piece and select piece for the opponent
+
+        :param board: the numpy board
+        :param square: the square to place the selected piece on
+        :param piece: the piece the opponent has to place next
+        :return: the new numpy board
+        '''
+        next_board = np.array(board)
+        flat = next_board.ravel()
+        selected = flat[self.center]
+        assert selected and not flat[self.board_squares[square]]
+
+        flat[self.board_squares[square]] = selected
+        if piece == selected & 0xF:
+            # the last move hands over the placed piece as a placeholder, nothing is left to select
+            assert flat[self.board_squares].all()
+            flat[self.center] = 0
+        else:
+            assert not (flat[self.board_squares] == self.TAKEN + piece).any()
+            flat[self.center] = self.TAKEN + piece
+        return next_board
+
+    def has_quatro(self, state: QuatroState) -> bool:
+        '''
+        :param state: the position
+        :return: True if any line holds 4 pieces that share a property
+        '''
+        return any(self._shares_property(state, line) for line in range(len(self.lines)))
+
+    def has_quatro_through(self, state: QuatroState, square: int) -> bool:
+        '''
+        :param state: the position
+        :param square: the square a piece was just placed on
+        :return: True if a line through square holds 4 pieces that share a property
+        '''
+        return any(self._shares_property(state, line) for line in self.square_lines[square])
+
+    @staticmethod
+    def bits(mask: int) -> np.ndarray:
+        '''
+        :param mask: a 16-bit mask of squares or pieces
+        :return: the bits of mask as 16 booleans, lowest first
+        '''
+        return (mask >> QuatroEngine.BIT_NUMBERS) & 1 != 0
+
+    def _shares_property(self, state: QuatroState, line: int) -> bool:
+        mask = self.line_masks[line]
+        if state.occupied & mask != mask:
+            return False
+        a, b, c, d = self.lines[line]
+        pieces = state.pieces
+        inverse = ~pieces
+        common = (pieces >> 4 * a) & (pieces >> 4 * b) & (pieces >> 4 * c) & (pieces >> 4 * d)
+        common |= (inverse >> 4 * a) & (inverse >> 4 * b) & (inverse >> 4 * c) & (inverse >> 4 * d)
+        return common & 0xF != 0
@@ -5,9 +5,13 @@ from typing import Tuple, List
 
 from alpha_zero.Player import Player
 from alpha_zero.Game import Game
+from alpha_zero.Symmetries import DihedralSymmetries
+from alpha_zero.ValidMovesMemo import ValidMovesMemo
+from alpha_zero.Zobrist import ZobristHash
 
 sys.path.append('..')
-from .QuatroBoard import QuatroBoard, Piece
+from .QuatroBoard import Piece
+from .QuatroEngine import QuatroEngine, action_tables
 import numpy as np
 
 from colorama import init
@@ -25,14 +29,28 @@ Based on the OthelloGame by Surag Nair.
 
 class QuatroGame(Game):
 
-    def __init__(self, n:int=5):
+    def __init__(self, n:int=5, valid_moves_memo: int = 0, factored_policy: bool = False):
+        """
+        :param n: the board is n x n, including the middle row and column
+        :param valid_moves_memo: number of states to remember the valid moves of, 0 for none
+        :param factored_policy: let the neural network predict a distribution over the squares and one
+                                over the pieces, instead of one over all (square, piece) actions
+        """
         self.n = n
+        self.factored_policy = factored_policy
+        self.engine = QuatroEngine(n)
+        self.actions = action_tables(n)
+        self.valid_moves_memo = ValidMovesMemo(valid_moves_memo) if valid_moves_memo else None
+        # The middle row and column are not part of the playing field, so the
+        # actions are (n-1) x (n-1) cells times the pieces, plus one
+        self.symmetries = DihedralSymmetries(n, n - 1, QuatroEngine.PIECES, 1)
+        # a cell is empty (0) or holds a piece (16 + the 4 property bits)
+        self.zobrist = ZobristHash(n * n, range(32))
 
 
     def getInitBoard(self) -> np.array:
         # return initial board (numpy board)
-        b = QuatroBoard(self.n)
-        return b.state
+        return self.engine.init_board()
 
     def getBoardSize(self) -> Tuple[int, int]:
         # (a,b) tuple
@@ -43,6 +61,31 @@ class QuatroGame(Game):
         # TODO in terms of n
         return (1 << (2 + 2 + self.n-1)) + 1
 
+    def getPolicySize(self) -> int:
+        if self.factored_policy:
+            # a distribution over the squares followed by one over the pieces
+            return QuatroEngine.SQUARES + QuatroEngine.PIECES
+        return self.getActionSize()
+
+    def expandPolicy(self, policy: np.ndarray, valid_moves: np.ndarray) -> np.ndarray:
+        if not self.factored_policy:
+            return policy * valid_moves
+        # the prior of placing on a square and selecting a piece is the product
+        # of the two, computed for the valid actions only
+        squares = policy[:QuatroEngine.SQUARES]
+        pieces = policy[QuatroEngine.SQUARES:]
+        actions = np.flatnonzero(valid_moves)
+        expanded = np.zeros(self.getActionSize())
+        expanded[actions] = squares[self.actions.squares[actions]] * pieces[self.actions.pieces[actions]]
+        return expanded
+
+    def getPolicyTarget(self, pi: np.ndarray) -> np.ndarray:
+        if not self.factored_policy:
+            return pi
+        # the probability of each square and of each piece
+        square_piece = np.asarray(pi)[self.actions.actions]
+        return np.concatenate([square_piece.sum(axis=1), square_piece.sum(axis=0)])
+
     def getNextState(self, board_state: np.ndarray, player: int, action: int) -> Tuple[np.ndarray, int]:
         """
         if player takes action on board, return next (board_state,player)
@@ -53,109 +96,102 @@ class QuatroGame(Game):
         :return nextBoard: board_state after applying action
         :return nextPlayer: player who plays in the next turn (should be -player)
         """
-        board = QuatroBoard(self.n, np.copy(board_state))
-        #
-        # if action == self.getActionSize()-1 :
-        #     # Means no pieces left, so just place the last piece
-        #     piece = board.selected_piece
-        #     x,y = board.empty_tiles[0]
-        # else:
-        x, y, piece = self.decodeAction(action)
-
-        if len(board.remaining_pieces)==0 and len(board.empty_tiles)==1:
-            pass
-            # print("Placing last piece")
-        else:
-            if piece in board.used_pieces or piece == board.selected_piece:
-                print("invalid state")
-                # Invalid, so your turn again
-                return board_state, player
-
-        # Perform the move
-        board.execute_move((x,y,piece), player)
+        # the action is the square to place the selected piece on and the piece to select,
+        # the last move of the game selects the placed piece as a placeholder
+        square = int(self.actions.squares[action])
+        piece = int(self.actions.pieces[action])
 
         # Next turn
-        return board.state, -player
+        return self.engine.play(board_state, square, piece), -player
 
 
     # This returns array of the actions that are fed into getNextState
-    def getValidMoves(self, board_state: np.ndarray, player: int):
-        # return a fixed size binary vector
-        valids = [0] * self.getActionSize()
-
-        board = QuatroBoard(n=self.n, board_state=board_state)
-
-        legalMoves = board.get_legal_moves(player)
-
-        # Means place last piece and end
-        if len(legalMoves) == 0:
-            x,y = board.empty_tiles[0]
-            p = board.selected_piece
-            valids[self.encodeAction((x, y, p))] = 1
-            return np.array(valids)
-
-        for x, y, p in legalMoves:
-            action = self.encodeAction((x, y, p))
-            valids[action] = 1
+    def getValidMoves(self, board_state: np.ndarray, player: int) -> np.ndarray:
+        # return a fixed size, read-only boolean vector
+        if self.valid_moves_memo is not None:
+            return self.valid_moves_memo.get((board_state.tobytes(), player),
+                                             lambda: self._valid_moves(board_state, player))
+        return self._valid_moves(board_state, player)
+
+    def _valid_moves(self, board_state: np.ndarray, player: int) -> np.ndarray:
+        valids = np.zeros(self.getActionSize(), dtype=np.bool_)
+
+        # every empty square with every piece that can be selected
+        squares, pieces = self.engine.legal(self.engine.pack(board_state))
+        valids[self.actions.actions] = np.logical_and.outer(self.engine.bits(squares), self.engine.bits(pieces))
+        valids.flags.writeable = False
         return valids
 
 
-    def getGameEnded(self, board_state: np.ndarray, player: int) -> int:
-        # return 0 if not ended, 1 if player 1 won, -1 if player 1 lost
-        # player = 1
-        board = QuatroBoard(self.n, board_state)
+    def getGameEnded(self, board_state: np.ndarray, player: int) -> float:
+        # return 0 if not ended, 1 if player won, -1 if player lost.
+        # The pieces have no color, so player is taken to be the player to move:
+        # a line with a common property was completed by the opponent, who wins
+        state = self.engine.pack(board_state)
 
-        if board.is_win(player):
-            return player
-        if board.has_legal_moves():
+        if self.engine.has_quatro(state):
+            return -1
+        if state.occupied != QuatroEngine.ALL:
             return 0
         # draw has a very little value 
         return 1e-4
 
+    def getGameEndedAfterMove(self, board_state: np.ndarray, player: int, action: int) -> float:
+        # only the lines through the square the piece was placed on can have been completed
+        state = self.engine.pack(board_state)
+
+        if self.engine.has_quatro_through(state, int(self.actions.squares[action])):
+            return -1
+        if state.occupied != QuatroEngine.ALL:
+            return 0
+        return 1e-4
+
     def getCanonicalForm(self, board_state: np.ndarray, player: int) -> np.ndarray:
         # return state if player==1, else return -state if player==-1
         return board_state
 
     def getSymmetries(self, board_state: np.array, action_prop_vector: List[float]):
         assert (len(action_prop_vector) == self.getActionSize())  # 1 for pass
-        pi_board = np.reshape(action_prop_vector[:-1], ((self.n - 1) ** 2, (self.n - 1) ** 2))
-        symmetrics = []
-
-        # mirror, rotational
-        for i in range(1, 5):
-            for j in [True, False]:
-                newB = np.rot90(board_state, i)
-                newPi = np.rot90(pi_board, i)
-                if+ j:
-                    newB = np.fliplr(newB)
-                    newPi = np.fliplr(newPi)
 
+        # mirror, rotational. The squares of the actions move with the board, the pieces do not
+        return [self.symmetries.apply(board_state, action_prop_vector, k) for k in range(len(self.symmetries))]
 
-                symmetrics += [(newB, list(newPi.ravel()) + [action_prop_vector[-1]])]
+    def getSymmetryPermutations(self) -> Tuple[np.ndarray, np.ndarray]:
+        if not self.factored_policy:
+            return self.symmetries.board_permutations, self.symmetries.policy_permutations
+        # the squares of the factored target move with the board, the pieces do not
+        pieces = np.arange(QuatroEngine.SQUARES, QuatroEngine.SQUARES + QuatroEngine.PIECES)
+        return self.symmetries.board_permutations, np.concatenate(
+            [self.symmetries.cell_permutations, np.tile(pieces, (len(self.symmetries), 1))], axis=1)
 
-        return symmetrics
+    def getCanonicalSymmetry(self, board_state: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # representative of the mirror, rotational symmetries
+        return self.symmetries.canonical(board_state)
 
     def stringRepresentation(self, board_state: np.array):
-        return board_state.tostring()
+        return board_state.tobytes()
+
+    def getStateKey(self, board_state: np.ndarray) -> int:
+        # Zobrist key of the board_state
+        return self.zobrist.key(board_state)
+
+    def getNextCanonicalState(self, board_state: np.ndarray, action: int, key: int) -> Tuple[np.ndarray, int]:
+        # only the cell the piece is placed on and the selected piece in the middle change
+        next_board, next_player = self.getNextState(board_state, 1, action)
+        key = self.zobrist.update_board(key, board_state, next_board)
+        return self.getCanonicalForm(next_board, next_player), key
 
     def encodeAction(self, action: Tuple[int, int, Piece]) -> int:
         x, y, piece = action
 
+        # the middle row and column are not part of the playing field
         if x > 1: x -= 1
         if y > 1: y -= 1
 
-        moveMask = self.n - 2
-        n_x = (x & moveMask) << (self.n-1 + 2)
-        n_y = (y & moveMask) << (self.n-1)
-        return n_x + n_y + (piece.toInt())
+        return int(self.actions.actions[x * 4 + y, piece.toInt()])
 
     def decodeAction(self, encoded_action: int) -> Tuple[int, int, Piece]:
-
-        propertyMask = (self.n -1)**2 -1
-
-        x = (encoded_action >> (self.n-1 + 2)) & 0b11
-        if x > 1: x +=1
-        y = (encoded_action >> (self.n-1)) & 0b11
-        if y > 1: y += 1
-        piece = Piece.fromInt(encoded_action & propertyMask)
+        square = self.actions.squares[encoded_action]
+        x, y = divmod(int(self.engine.board_squares[square]), self.n)
+        piece = Piece.fromInt(int(self.actions.pieces[encoded_action]))
         return x, y, piece
\ No newline at end of file
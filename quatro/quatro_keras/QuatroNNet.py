@@ -1,9 +1,10 @@
 from keras.optimizers import Adam
 
 from keras import Model, Input
-from keras.layers import Activation, BatchNormalization, Conv2D, Dense, Dropout, Flatten, Reshape
+from keras.layers import Activation, BatchNormalization, Concatenate, Conv2D, Dense, Dropout, Flatten, Reshape
 
 from alpha_zero.Game import Game
+from quatro.QuatroEngine import QuatroEngine
 
 
 """
@@ -32,7 +33,13 @@ class QuatroNNet():
         h_conv4_flat = Flatten()(h_conv4)       
         s_fc1 = Dropout(args.dropout)(Activation('relu')(BatchNormalization(axis=1)(Dense(1024)(h_conv4_flat))))  # batch_size x 1024
         s_fc2 = Dropout(args.dropout)(Activation('relu')(BatchNormalization(axis=1)(Dense(512)(s_fc1))))          # batch_size x 1024
-        self.pi = Dense(self.action_size, activation='softmax', name='pi')(s_fc2)   # batch_size x self.action_size
+        if game.getPolicySize() != self.action_size:
+            # factored policy: a distribution over the squares and one over the pieces
+            squares = Dense(QuatroEngine.SQUARES, activation='softmax')(s_fc2)               # batch_size x 16
+            pieces = Dense(QuatroEngine.PIECES, activation='softmax')(s_fc2)                 # batch_size x 16
+            self.pi = Concatenate(name='pi')([squares, pieces])                              # batch_size x 32
+        else:
+            self.pi = Dense(self.action_size, activation='softmax', name='pi')(s_fc2)   # batch_size x self.action_size
         self.v = Dense(1, activation='tanh', name='v')(s_fc2)                    # batch_size x 1
 
         self.model = Model(inputs=self.input_boards, outputs=[self.pi, self.v])
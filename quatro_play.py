@@ -20,7 +20,7 @@ human_player = HumanPlayer(game,"human")
 # neural_net = NNet(game)
 # neural_net.load_checkpoint('./pretrained_models/quatro/keras/','best-25eps-25sim-10epch.pth.tar')
 
-args1 = dotdict({'numMCTSSims': 25, 'cpuct':1.0})
+args1 = dotdict({'numMCTSSims': 25, 'cpuct':1.0, 'mctsMaxBytes': 64 * 2 ** 20})
 ai_player = KerasNeuralNetPlayer(game,args1,"AI")
 
 if __name__ == '__main__':
@@ -32,5 +32,6 @@ if __name__ == '__main__':
 
     results_format = 'Results (Won,Lost,Draws)={0}'.format(results)
     print(results_format)
+    print(ai_player.mcts1.nodes.summary())
     print("")
 
@@ -2,6 +2,9 @@ from __future__ import print_function
 
 
 from alpha_zero.Game import Game
+from alpha_zero.InARow import InARow
+from alpha_zero.Symmetries import DihedralSymmetries
+from alpha_zero.Zobrist import ZobristHash
 from tictactoe.TicTacToeBoard import TicTacToeBoard as Board
 
 import numpy as np
@@ -18,6 +21,9 @@ Based on the OthelloGame by Surag Nair.
 class TicTacToeGame(Game):
     def __init__(self, n=3):
         self.n = n
+        self.symmetries = DihedralSymmetries(n)
+        self.in_a_row = InARow(n, n)
+        self.zobrist = ZobristHash(n*n, (-1, 0, 1), negatable=True)
 
     def getInitBoard(self):
         # return initial board (numpy board)
@@ -44,32 +50,35 @@ class TicTacToeGame(Game):
         return (b.pieces, -player)
 
     def getValidMoves(self, board_state, player):
-        # return a fixed size binary vector
-        valids = [0]*self.getActionSize()
-        b = Board(self.n, board_state)
-
-        legalMoves =  b.get_legal_moves(player)
-        if len(legalMoves)==0:
-            valids[-1]=1
-            return np.array(valids)
-        for x, y in legalMoves:
-            valids[self.n*x+y]=1
-        return np.array(valids)
+        # return a fixed size, read-only boolean vector: the empty squares, or pass when there are none
+        valids = np.zeros(self.getActionSize(), dtype=np.bool_)
+        np.equal(board_state.ravel(), 0, out=valids[:-1])
+        valids[-1] = not valids[:-1].any()
+        valids.flags.writeable = False
+        return valids
 
     def getGameEnded(self, board_state, player):
         # return 0 if not ended, 1 if player 1 won, -1 if player 1 lost
         # player = 1
-        b = Board(self.n, board_state)
-
-        if b.is_win(player):
-            return 1
-        if b.is_win(-player):
-            return -1
-        if b.has_legal_moves():
+        winner = self.in_a_row.winner(board_state)
+        if winner != 0:
+            return player * winner
+        if (board_state == 0).any():
             return 0
         # draw has a very little value 
         return 1e-4
 
+    def getGameEndedAfterMove(self, board_state, player, action):
+        # only the lines through the stone just placed can have been completed
+        if action == self.n*self.n:
+            return self.getGameEnded(board_state, player)
+        x, y = divmod(action, self.n)
+        if self.in_a_row.wins_through(board_state, x, y):
+            return player * board_state[x][y]
+        if (board_state == 0).any():
+            return 0
+        return 1e-4
+
     def getCanonicalForm(self, board_state, player):
         # return state if player==1, else return -state if player==-1
         return player * board_state
@@ -77,20 +86,27 @@ class TicTacToeGame(Game):
     def getSymmetries(self, board_state, pi):
         # mirror, rotational
         assert(len(pi) == self.n**2+1)  # 1 for pass
-        pi_board = np.reshape(pi[:-1], (self.n, self.n))
-        l = []
-
-        for i in range(1, 5):
-            for j in [True, False]:
-                newB = np.rot90(board_state, i)
-                newPi = np.rot90(pi_board, i)
-                if j:
-                    newB = np.fliplr(newB)
-                    newPi = np.fliplr(newPi)
-                l += [(newB, list(newPi.ravel()) + [pi[-1]])]
-        return l
+        return [self.symmetries.apply(board_state, pi, k) for k in range(len(self.symmetries))]
+
+    def getSymmetryPermutations(self):
+        return self.symmetries.board_permutations, self.symmetries.policy_permutations
+
+    def getCanonicalSymmetry(self, board_state):
+        # representative of the mirror, rotational symmetries
+        return self.symmetries.canonical(board_state)
 
     def stringRepresentation(self, board_state):
         # 8x8 numpy array (canonical board_state)
-        return board_state.tostring()
+        return board_state.tobytes()
+
+    def getStateKey(self, board_state):
+        # Zobrist key of the canonical board_state
+        return self.zobrist.key(board_state)
+
+    def getNextCanonicalState(self, board_state, action, key):
+        # the new stone is the only changed cell, the opponent's view negates the key
+        next_board, next_player = self.getNextState(board_state, 1, action)
+        if action != self.n*self.n:
+            key = self.zobrist.update(key, action, 0, 1)
+        return self.getCanonicalForm(next_board, next_player), self.zobrist.negate(key)
 
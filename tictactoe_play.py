@@ -18,7 +18,7 @@ game = TicTacToeGame(3)
 random_player1 = RandomPlayer(game, "Random1")
 random_player2 = RandomPlayer(game, "Random1")
 human_player = HumanPlayer(game, "Human")
-args1 = dotdict({'numMCTSSims': 25, 'cpuct': 1.0})
+args1 = dotdict({'numMCTSSims': 25, 'cpuct': 1.0, 'mctsMaxNodes': 10000})
 
 
 # nnet players
@@ -35,6 +35,7 @@ if __name__ == '__main__':
     results = arena.play_games(2, verbose=True)
     results_format = 'Results {0}'.format(results)
     print(results_format)
+    print(neural_net_player1.mcts1.nodes.summary())
     print("")
 
 